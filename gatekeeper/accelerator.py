@@ -0,0 +1,235 @@
+import functools
+
+from keysyms import KEYSYMS
+
+try:
+    from xkbcommon import xkb
+except ImportError:
+    xkb = None
+
+# Accelerator parsing without GTK.
+#
+# Accepts the GTK syntax ("<Control><Alt>s", "<Shift_L>F5") as well as the
+# "+"-separated form ("Ctrl+Alt+s", "Meta+a") and returns the
+# (modifiers, keysym) pair used by ext_input_trigger_registration_v1, or
+# (0, 0) if the string is not a valid accelerator. Letters are reduced to
+# their lower case keysym, as Gtk.accelerator_parse does.
+
+# ext_input_trigger_registration_v1.modifiers
+MOD_ALT = 0x01
+MOD_ALT_LEFT = 0x02
+MOD_ALT_RIGHT = 0x04
+MOD_SHIFT = 0x08
+MOD_SHIFT_LEFT = 0x10
+MOD_SHIFT_RIGHT = 0x20
+MOD_SYM = 0x40
+MOD_FUNCTION = 0x80
+MOD_CTRL = 0x100
+MOD_CTRL_LEFT = 0x200
+MOD_CTRL_RIGHT = 0x400
+MOD_META = 0x800
+MOD_META_LEFT = 0x1000
+MOD_META_RIGHT = 0x2000
+
+# Modifier names, lower case. The GTK names map to the "any" variants; Super
+# is the key the compositor calls Meta. The protocol has no Hyper, which
+# shares Mod4 with Super in the common layouts.
+MODIFIERS = {
+    'alt': MOD_ALT,
+    'mod1': MOD_ALT,
+    'alt_l': MOD_ALT_LEFT,
+    'alt_r': MOD_ALT_RIGHT,
+    'shift': MOD_SHIFT,
+    'shft': MOD_SHIFT,
+    'shift_l': MOD_SHIFT_LEFT,
+    'shift_r': MOD_SHIFT_RIGHT,
+    'sym': MOD_SYM,
+    'function': MOD_FUNCTION,
+    'fn': MOD_FUNCTION,
+    'control': MOD_CTRL,
+    'ctrl': MOD_CTRL,
+    'ctl': MOD_CTRL,
+    'primary': MOD_CTRL,
+    'control_l': MOD_CTRL_LEFT,
+    'ctrl_l': MOD_CTRL_LEFT,
+    'control_r': MOD_CTRL_RIGHT,
+    'ctrl_r': MOD_CTRL_RIGHT,
+    'meta': MOD_META,
+    'super': MOD_META,
+    'logo': MOD_META,
+    'hyper': MOD_META,
+    'meta_l': MOD_META_LEFT,
+    'super_l': MOD_META_LEFT,
+    'meta_r': MOD_META_RIGHT,
+    'super_r': MOD_META_RIGHT
+}
+
+# Fallback for names written in a different case ("escape", "PAGE_UP")
+KEYSYMS_FOLDED = {}
+for name, keysym in KEYSYMS.items():
+    KEYSYMS_FOLDED.setdefault(name.lower(), keysym)
+
+def keysym_to_lower(keysym):
+    # Like gdk_keyval_to_lower, which Gtk.accelerator_parse applies
+    if 0x41 <= keysym <= 0x5a or (0xc0 <= keysym <= 0xde and keysym != 0xd7):
+        return keysym + 0x20
+    if keysym & 0xff000000 == 0x01000000:
+        lower = chr(keysym & 0x00ffffff).lower()
+        return 0x01000000 | ord(lower) if len(lower) == 1 else keysym
+    if xkb is not None:
+        return xkb.keysym_to_lower(keysym)
+    return keysym
+
+def lookup_keysym(name):
+    keysym = KEYSYMS.get(name)
+    if keysym is not None:
+        return keysym
+    if len(name) == 1:
+        # Latin-1 characters map directly, any other one to its Unicode keysym
+        code = ord(name)
+        return code if 0x20 <= code <= 0xff else 0x01000000 | code
+    keysym = KEYSYMS_FOLDED.get(name.lower())
+    if keysym is not None:
+        return keysym
+    if xkb is not None:
+        try:
+            keysym = xkb.keysym_from_name(name) or xkb.keysym_from_name(name, case_insensitive=True)
+        except UnicodeEncodeError:
+            return 0
+        if keysym:
+            return keysym
+    if name[:2] in ('0x', '0X'):
+        try:
+            return int(name, 16)
+        except ValueError:
+            return 0
+    return 0
+
+def keysym_from_name(name):
+    # Letters are reduced to lower case, like GTK does
+    return keysym_to_lower(lookup_keysym(name))
+
+# Names used when writing accelerators back out, in GTK order
+MODIFIER_NAMES = (
+    (MOD_CTRL, 'Control'), (MOD_CTRL_LEFT, 'Control_L'), (MOD_CTRL_RIGHT, 'Control_R'),
+    (MOD_SHIFT, 'Shift'), (MOD_SHIFT_LEFT, 'Shift_L'), (MOD_SHIFT_RIGHT, 'Shift_R'),
+    (MOD_ALT, 'Alt'), (MOD_ALT_LEFT, 'Alt_L'), (MOD_ALT_RIGHT, 'Alt_R'),
+    (MOD_META, 'Super'), (MOD_META_LEFT, 'Super_L'), (MOD_META_RIGHT, 'Super_R'),
+    (MOD_FUNCTION, 'Fn'), (MOD_SYM, 'Sym')
+)
+# The side-specific bits of each modifier and the bit that means either side
+MODIFIER_SIDES = (
+    (MOD_CTRL, MOD_CTRL_LEFT | MOD_CTRL_RIGHT),
+    (MOD_SHIFT, MOD_SHIFT_LEFT | MOD_SHIFT_RIGHT),
+    (MOD_ALT, MOD_ALT_LEFT | MOD_ALT_RIGHT),
+    (MOD_META, MOD_META_LEFT | MOD_META_RIGHT)
+)
+
+def fold_modifiers(mods):
+    # "<Control_L><Alt_R>" -> "<Control><Alt>", for comparing combinations
+    # regardless of the side a modifier is held on
+    for mod, sides in MODIFIER_SIDES:
+        if mods & sides:
+            mods = (mods & ~sides) | mod
+    return mods
+
+# The first name listed for a keysym wins ("Page_Up" over "Prior")
+KEYSYM_NAMES = {keysym: name for name, keysym in reversed(KEYSYMS.items())}
+
+def keysym_to_name(keysym):
+    name = KEYSYM_NAMES.get(keysym)
+    if name is not None:
+        return name
+    if 0x20 <= keysym <= 0xff:
+        return chr(keysym)
+    if keysym & 0xff000000 == 0x01000000:
+        return chr(keysym & 0x00ffffff)
+    if xkb is not None:
+        try:
+            return xkb.keysym_get_name(keysym)
+        except xkb.XKBInvalidKeysym:
+            pass
+    return f'{keysym:#x}'
+
+def format_modifiers(mods):
+    return ''.join(f'<{name}>' for mod, name in MODIFIER_NAMES if mods & mod)
+
+def format_accelerator(mods, keysym):
+    # The inverse of parse_accelerator, in the GTK syntax. Every spelling of
+    # one key combination comes out the same.
+    return format_modifiers(mods) + keysym_to_name(keysym)
+
+def split_accelerator(accel_string):
+    accel = accel_string.strip()
+    modifiers = []
+    if accel.startswith('<'):
+        while accel.startswith('<'):
+            end = accel.find('>')
+            if end == -1:
+                return None, None
+            modifiers.append(accel[1:end])
+            accel = accel[end + 1:].lstrip()
+        return modifiers, accel
+    # "Ctrl+Alt+s"; a trailing "+" is the plus key itself
+    parts = accel.split('+')
+    if len(parts) > 1 and parts[-1] == '' and parts[-2] == '':
+        parts = parts[:-2] + ['+']
+    return parts[:-1], parts[-1]
+
+# A trigger bound to a physical key instead of the keysym the key produces
+# in the current layout carries this prefix, e.g. "code:<Alt>z". It is
+# registered with register_keyboard_code_trigger and parses like the
+# accelerator without it.
+CODE_PREFIX = 'code:'
+TRIGGER_KIND_SYM = 'sym'
+TRIGGER_KIND_CODE = 'code'
+
+def split_trigger(trigger):
+    # trigger -> (accelerator, bound to the physical key)
+    if trigger.startswith(CODE_PREFIX):
+        return trigger[len(CODE_PREFIX):], True
+    return trigger, False
+
+def join_trigger(accel, by_code):
+    return CODE_PREFIX + accel if by_code else accel
+
+def preferred_trigger(options):
+    # The preferred trigger of BindShortcuts options, of the kind asked for
+    # by their 'trigger_kind' ("sym", the default, or "code")
+    trigger = options.get('preferred_trigger', '')
+    if not trigger:
+        return trigger
+    accel, by_code = split_trigger(trigger)
+    return join_trigger(accel, by_code or options.get('trigger_kind') == TRIGGER_KIND_CODE)
+
+def parse_modifiers(modifier_names):
+    # The modifier bits of the names, or None if one is not a modifier
+    mods = 0
+    for name in modifier_names:
+        mod = MODIFIERS.get(name.strip().lower())
+        if mod is None:
+            return None
+        mods |= mod
+    return mods
+
+@functools.lru_cache(maxsize=512)
+def parse_accelerator(accel_string):
+    if not accel_string:
+        return 0, 0
+    accel_string = split_trigger(accel_string)[0]
+    modifier_names, key = split_accelerator(accel_string)
+    if modifier_names is None or not key:
+        return 0, 0
+    mods = parse_modifiers(modifier_names)
+    if mods is None:
+        return 0, 0
+    keysym = keysym_from_name(key.strip())
+    if not keysym:
+        return 0, 0
+    return mods, keysym
+
+def parse_accelerators(triggers):
+    # Parses every trigger of one BindShortcuts request at once:
+    # {shortcut_id: accelerator} -> {shortcut_id: (modifiers, keysym)}.
+    # Invalid triggers are reported as (0, 0) like parse_accelerator does.
+    return {s_id: parse_accelerator(accel) for s_id, accel in triggers.items()}
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+import time
+
+import accelerator
+
+# Compares accelerator parsing with the accelerator module against
+# Gtk.accelerator_parse, which gatekeeper used before and which needs GTK to
+# be loaded. The accelerator module is measured both with a cold cache and
+# with every trigger already cached, as for shortcuts bound again. With GTK
+# available, both parsers must also agree on every trigger; the exit status
+# is 1 if they do not.
+
+TRIGGERS = [
+    "<Control>q", "<Control><Alt>s", "<Shift><Super>Return", "<Alt>F4",
+    "<Control><Shift>Escape", "<Super>1", "<Control>Page_Up", "<Alt>space",
+    "<Control><Alt>Delete", "<Super>XF86AudioPlay", "<Shift>KP_Add", "<Control>bracketleft",
+    "<Super>Caps_Lock", "<Control>KP_Home", "XF86PowerOff", "XF86Eject", "<Super>XF86Launch1",
+    "XF86Display", "<Alt>adiaeresis", "<Alt>Adiaeresis", "<Ctl><Shft>t", "<Hyper>h",
+    "<Control>Prior", "<Shift>ISO_Left_Tab"
+]
+
+def time_per_call(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for trigger in TRIGGERS:
+            func(trigger)
+    return (time.perf_counter() - start) / (rounds * len(TRIGGERS)) * 1e6
+
+def gtk_parser():
+    try:
+        import gi
+        gi.require_version('Gtk', '4.0')
+        from gi.repository import Gtk
+    except (ImportError, ValueError) as e:
+        print(f"gtk: not available: {e}", file=sys.stderr)
+        return None
+    from gi.repository import Gdk
+    # Gdk modifiers in the protocol's terms, the way gatekeeper converted them
+    # when it used GTK; Super and Hyper are both the compositor's Meta
+    masks = (
+        (Gdk.ModifierType.SHIFT_MASK, accelerator.MOD_SHIFT),
+        (Gdk.ModifierType.CONTROL_MASK, accelerator.MOD_CTRL),
+        (Gdk.ModifierType.ALT_MASK, accelerator.MOD_ALT),
+        (Gdk.ModifierType.META_MASK | Gdk.ModifierType.SUPER_MASK | Gdk.ModifierType.HYPER_MASK, accelerator.MOD_META)
+    )
+
+    def parse(trigger):
+        valid, keyval, modifiers = Gtk.accelerator_parse(trigger)
+        if not valid:
+            return 0, 0
+        return sum(mod for mask, mod in masks if modifiers & mask), keyval
+    return parse
+
+def mismatches(gtk_parse):
+    # Triggers the two parsers read differently: [(trigger, ours, gtk)]
+    found = []
+    for trigger in TRIGGERS:
+        ours, theirs = accelerator.parse_accelerator(trigger), gtk_parse(trigger)
+        if ours != theirs:
+            found.append((trigger, ours, theirs))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Accelerator parsing cost with and without GTK")
+    parser.add_argument('-n', '--rounds', type=int, default=10000, help="passes over the trigger list")
+    parser.add_argument('--json', action='store_true', help="print a machine-readable report")
+    args = parser.parse_args()
+
+    def uncached(trigger):
+        accelerator.parse_accelerator.cache_clear()
+        accelerator.parse_accelerator(trigger)
+
+    report = {
+        'uncached': time_per_call(uncached, args.rounds),
+        'cached': time_per_call(accelerator.parse_accelerator, args.rounds)
+    }
+    start = time.perf_counter()
+    gtk_parse = gtk_parser()
+    if gtk_parse:
+        report['gtk_load'] = (time.perf_counter() - start) * 1e6
+        report['gtk'] = time_per_call(gtk_parse, args.rounds)
+        different = mismatches(gtk_parse)
+    else:
+        different = []
+
+    if args.json:
+        print(json.dumps(dict(report, mismatches=[trigger for trigger, _, _ in different]), indent=2))
+    else:
+        for name, us in report.items():
+            print(f"{name:<10} {us:>12.3f} us")
+        for trigger, ours, theirs in different:
+            print(f"mismatch   {trigger!r}: {ours} here, {theirs} with GTK")
+    return 1 if different else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
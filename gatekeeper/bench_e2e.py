@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from gi.repository import GLib, Gio
+
+from sample_triggers import unique_triggers
+
+# End-to-end benchmark of gatekeeper against fake_compositor.py.
+#
+# Everything runs in a private environment: a dbus-daemon session bus of its
+# own, a temporary XDG_RUNTIME_DIR for the Wayland socket and an empty
+# XDG_STATE_HOME, with GATEKEEPER_AUTO_ACCEPT=1 standing in for the user
+# approving the shortcut dialog. Reported:
+#
+#   time_to_bind_N_ms      BindShortcuts latency for one session binding N shortcuts
+#   bind_throughput_per_s  answered BindShortcuts per second with many sessions at once
+#   activation_pXX_ms      key press injected into the compositor -> Activated received
+#   rss_per_session_kib    gatekeeper RSS growth per session (and wayland objects per session)
+#
+# --max/--min METRIC=VALUE make the run fail when a metric is out of bounds,
+# which is how CI catches regressions.
+
+BUS_NAME = "org.freedesktop.impl.portal.desktop.mir"
+PORTAL_PATH = "/org/freedesktop/portal/desktop"
+PORTAL_INTERFACE = "org.freedesktop.impl.portal.GlobalShortcuts"
+SESSION_INTERFACE = "org.freedesktop.impl.portal.Session"
+STATS_INTERFACE = "org.freedesktop.impl.portal.desktop.mir.Gatekeeper.Stats"
+CALL_TIMEOUT_MS = 30000
+
+CLIENT_XML = """
+<node>
+  <interface name="org.freedesktop.portal.GlobalShortcuts">
+    <method name="Activated">
+      <arg type="s" name="shortcut_id" direction="in"/>
+      <arg type="u" name="timestamp" direction="in"/>
+      <arg type="a{sv}" name="options" direction="in"/>
+    </method>
+    <method name="Deactivated">
+      <arg type="s" name="shortcut_id" direction="in"/>
+      <arg type="u" name="timestamp" direction="in"/>
+      <arg type="a{sv}" name="options" direction="in"/>
+    </method>
+  </interface>
+</node>
+"""
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def read_rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+class Environment:
+    # The private bus, the fake compositor and gatekeeper itself
+    def __init__(self, latency_ms):
+        self.script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.tmp = tempfile.mkdtemp(prefix='gatekeeper-bench-')
+        self.latency_ms = latency_ms
+        self.processes = []
+        self.compositor = None
+        self.gatekeeper = None
+        self.log_path = os.path.join(self.tmp, 'gatekeeper.log')
+
+    def start(self):
+        runtime_dir = os.path.join(self.tmp, 'runtime')
+        os.mkdir(runtime_dir, 0o700)
+        env = dict(os.environ, XDG_RUNTIME_DIR=runtime_dir, XDG_STATE_HOME=os.path.join(self.tmp, 'state'))
+
+        bus = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        self.processes.append(bus)
+        env['DBUS_SESSION_BUS_ADDRESS'] = bus.stdout.readline().strip()
+
+        self.compositor = subprocess.Popen(
+            [sys.executable, os.path.join(self.script_dir, 'fake_compositor.py'),
+             '--socket', 'gatekeeper-bench-0', '--latency-ms', str(self.latency_ms)],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.processes.append(self.compositor)
+        ready = self.compositor.stdout.readline().split()
+        if not ready or ready[0] != 'ready':
+            raise RuntimeError("fake compositor did not start")
+        env['WAYLAND_DISPLAY'] = ready[1]
+
+        env['GATEKEEPER_AUTO_ACCEPT'] = '1'
+        env.setdefault('GATEKEEPER_LOG_LEVEL', 'WARNING')
+        with open(self.log_path, 'w') as log:
+            self.gatekeeper = subprocess.Popen([sys.executable, os.path.join(self.script_dir, 'gatekeeper.py')],
+                                               env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append(self.gatekeeper)
+
+        connection = Gio.DBusConnection.new_for_address_sync(
+            env['DBUS_SESSION_BUS_ADDRESS'],
+            Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+            None, None)
+        deadline = time.monotonic() + 10
+        while not self.has_owner(connection):
+            if self.gatekeeper.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"gatekeeper did not start, see {self.log_path}")
+            time.sleep(0.05)
+        return connection
+
+    def has_owner(self, connection):
+        reply = connection.call_sync("org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus",
+                                     "NameHasOwner", GLib.Variant('(s)', (BUS_NAME,)), None,
+                                     Gio.DBusCallFlags.NONE, -1, None)
+        return reply.unpack()[0]
+
+    def inject(self, command):
+        self.compositor.stdin.write(command + '\n')
+        self.compositor.stdin.flush()
+
+    def stop(self, keep_logs=False):
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if not keep_logs:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+class Client:
+    # One bus connection acting as any number of portal sessions
+    def __init__(self, connection):
+        self.connection = connection
+        self.context = GLib.MainContext.default()
+        self.interface_info = Gio.DBusNodeInfo.new_for_xml(CLIENT_XML).interfaces[0]
+        self.triggers = unique_triggers()
+        self.next_id = 0
+        self.objects = {} # session handle -> registration id
+        self.activated = {} # (session handle, shortcut id) -> monotonic time
+
+    def run_until(self, done, timeout=CALL_TIMEOUT_MS / 1000):
+        deadline = time.monotonic() + timeout
+        while not done():
+            if time.monotonic() > deadline:
+                raise RuntimeError("timed out waiting for gatekeeper")
+            self.context.iteration(True)
+
+    def call_async(self, method, args, results, key, interface=PORTAL_INTERFACE, path=PORTAL_PATH):
+        started = time.monotonic()
+
+        def on_done(connection, result, data):
+            try:
+                reply = connection.call_finish(result).unpack()
+            except GLib.Error as e:
+                reply = e
+            results[key] = (time.monotonic() - started, reply)
+        self.connection.call(BUS_NAME, path, interface, method, args, None, Gio.DBusCallFlags.NONE,
+                             CALL_TIMEOUT_MS, None, on_done, None)
+
+    def call(self, method, args, interface=PORTAL_INTERFACE, path=PORTAL_PATH):
+        results = {}
+        self.call_async(method, args, results, 0, interface, path)
+        self.run_until(lambda: results)
+        elapsed, reply = results[0]
+        if isinstance(reply, GLib.Error):
+            raise RuntimeError(f"{method} failed: {reply.message}")
+        return elapsed, reply
+
+    def new_session(self):
+        self.next_id += 1
+        session_handle = f"/org/freedesktop/portal/desktop/session/bench/s{self.next_id}"
+        self.objects[session_handle] = self.connection.register_object(
+            session_handle, self.interface_info, self.on_client_method_call, None, None)
+        self.call("CreateSession", GLib.Variant("(oosa{sv})", (
+            f"/org/freedesktop/portal/desktop/request/bench/c{self.next_id}", session_handle,
+            f"org.example.Bench{self.next_id}", {})))
+        return session_handle
+
+    def bind_args(self, session_handle, count):
+        self.next_id += 1
+        shortcuts = [(f"action{i}", {
+            'description': GLib.Variant('s', f"Action {i}"),
+            'preferred_trigger': GLib.Variant('s', next(self.triggers))
+        }) for i in range(count)]
+        return GLib.Variant("(ooa(sa{sv})sa{sv})", (
+            f"/org/freedesktop/portal/desktop/request/bench/b{self.next_id}", session_handle, shortcuts, "", {}))
+
+    def close_sessions(self):
+        for session_handle, registration_id in self.objects.items():
+            self.call("Close", None, SESSION_INTERFACE, session_handle)
+            self.connection.unregister_object(registration_id)
+        self.objects.clear()
+        # Triggers released by the closed sessions can be handed out again
+        self.triggers = unique_triggers()
+
+    def on_client_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        if method_name == "Activated":
+            s_id = parameters.unpack()[0]
+            self.activated[(object_path, s_id)] = time.monotonic()
+        invocation.return_value(None)
+
+def bench_time_to_bind(client, sizes, runs):
+    report = {}
+    for size in sizes:
+        samples = []
+        for _ in range(runs):
+            session_handle = client.new_session()
+            elapsed, (response, results) = client.call("BindShortcuts", client.bind_args(session_handle, size))
+            if response != 0 or len(results['shortcuts']) != size:
+                raise RuntimeError(f"binding {size} shortcuts failed: {response}")
+            samples.append(elapsed)
+            client.close_sessions()
+        report[f'time_to_bind_{size}_ms'] = statistics.median(samples) * 1000
+    return report
+
+def bench_throughput(client, sessions, shortcuts):
+    handles = [client.new_session() for _ in range(sessions)]
+    requests = [client.bind_args(handle, shortcuts) for handle in handles]
+    results = {}
+    started = time.monotonic()
+    for i, args in enumerate(requests):
+        client.call_async("BindShortcuts", args, results, i)
+    client.run_until(lambda: len(results) == sessions)
+    elapsed = time.monotonic() - started
+    failed = sum(1 for latency, reply in results.values() if isinstance(reply, GLib.Error) or reply[0] != 0)
+    latencies = [latency for latency, reply in results.values()]
+    client.close_sessions()
+    return {
+        'bind_throughput_per_s': sessions / elapsed,
+        'bind_concurrent_p99_ms': percentile(latencies, 99) * 1000,
+        'bind_failed': failed
+    }
+
+def bench_activation(env, client, presses, shortcuts):
+    session_handle = client.new_session()
+    elapsed, (response, results) = client.call("BindShortcuts", client.bind_args(session_handle, shortcuts))
+    tokens = {s_id: data['trigger_action_token'] for s_id, data in results['shortcuts']}
+    latencies = []
+    for i in range(presses):
+        s_id = f"action{i % len(tokens)}"
+        key = (session_handle, s_id)
+        client.activated.pop(key, None)
+        started = time.monotonic()
+        env.inject(f"press {tokens[s_id]}")
+        client.run_until(lambda: key in client.activated)
+        latencies.append(client.activated[key] - started)
+    client.close_sessions()
+    return {
+        'activation_p50_ms': percentile(latencies, 50) * 1000,
+        'activation_p90_ms': percentile(latencies, 90) * 1000,
+        'activation_p99_ms': percentile(latencies, 99) * 1000,
+        'activation_max_ms': max(latencies) * 1000
+    }
+
+def bench_memory(env, client, sessions, shortcuts):
+    def live_objects():
+        elapsed, (stats,) = client.call("GetStats", None, STATS_INTERFACE)
+        return stats['wayland_objects']
+
+    before = read_rss_kib(env.gatekeeper.pid)
+    objects_before = live_objects()
+    handles = [client.new_session() for _ in range(sessions)]
+    results = {}
+    for i, handle in enumerate(handles):
+        client.call_async("BindShortcuts", client.bind_args(handle, shortcuts), results, i)
+    client.run_until(lambda: len(results) == sessions)
+    after = read_rss_kib(env.gatekeeper.pid)
+    objects_after = live_objects()
+    client.close_sessions()
+    return {
+        'rss_per_session_kib': (after - before) / sessions,
+        'wayland_objects_per_session': (objects_after - objects_before) / sessions,
+        'wayland_objects_after_close': live_objects() - objects_before
+    }
+
+def parse_limits(values):
+    limits = {}
+    for value in values or []:
+        metric, _, bound = value.partition('=')
+        limits[metric] = float(bound)
+    return limits
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end gatekeeper benchmark against a fake compositor")
+    parser.add_argument('--sizes', default='1,10,100', help="shortcut counts for time-to-bind")
+    parser.add_argument('--runs', type=int, default=5, help="samples per time-to-bind size")
+    parser.add_argument('--sessions', type=int, default=100, help="concurrent sessions for throughput and memory")
+    parser.add_argument('--shortcuts', type=int, default=4, help="shortcuts per concurrent session")
+    parser.add_argument('--presses', type=int, default=500, help="injected key presses")
+    parser.add_argument('--latency-ms', type=int, default=0, help="fake compositor reply latency")
+    parser.add_argument('--max', action='append', metavar='METRIC=VALUE', help="fail if METRIC is above VALUE")
+    parser.add_argument('--min', action='append', metavar='METRIC=VALUE', help="fail if METRIC is below VALUE")
+    parser.add_argument('--keep-logs', action='store_true', help="keep the temporary directory with the logs")
+    parser.add_argument('--json', action='store_true', help="print a machine-readable report")
+    args = parser.parse_args()
+
+    env = Environment(args.latency_ms)
+    report = {}
+    finished = False
+    try:
+        client = Client(env.start())
+        report.update(bench_time_to_bind(client, [int(n) for n in args.sizes.split(',')], args.runs))
+        report.update(bench_throughput(client, args.sessions, args.shortcuts))
+        report.update(bench_activation(env, client, args.presses, args.shortcuts))
+        report.update(bench_memory(env, client, args.sessions, args.shortcuts))
+        finished = True
+    except (RuntimeError, GLib.Error, KeyError) as e:
+        # KeyError: a reply without the expected results
+        print(f"benchmark failed: {e!r}", file=sys.stderr)
+        print(f"gatekeeper log: {env.log_path}", file=sys.stderr)
+        return 1
+    finally:
+        # Whatever went wrong, no bus, compositor or gatekeeper is left behind
+        env.stop(keep_logs=args.keep_logs or not finished)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for metric, value in report.items():
+            print(f"{metric:<32} {value:>12.3f}")
+
+    failures = [f"{metric} = {report.get(metric)} > {bound}" for metric, bound in parse_limits(args.max).items()
+                if report.get(metric, float('inf')) > bound]
+    failures += [f"{metric} = {report.get(metric)} < {bound}" for metric, bound in parse_limits(args.min).items()
+                 if report.get(metric, float('-inf')) < bound]
+    for failure in failures:
+        print(f"regression: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
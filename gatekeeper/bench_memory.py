@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+
+from records import ActivationRoute, Session, Shortcut
+
+# Bytes of portal state per shortcut, with the nested dicts gatekeeper used
+# before ('dicts') and with the slotted records ('records'). Every string is
+# built anew per session, as it arrives from D-Bus, so interning shows. The
+# compositor registrations are shared through the TriggerPool and hold
+# Wayland proxies that need a compositor; each shortcut gets a stand-in
+# holding its token in both layouts.
+
+class Registration:
+    __slots__ = ('token',)
+
+    def __init__(self, token):
+        self.token = token
+
+def fresh(text):
+    # A copy of text that is not the same object, like a string unpacked
+    # from a D-Bus message
+    return ''.join(list(text))
+
+def session_strings(n, apps, per_session):
+    app_id = fresh(f"org.example.App{n % apps}")
+    sender = f":1.{n}"
+    handle = f"/org/freedesktop/portal/desktop/session/{n}"
+    shortcuts = [(fresh(f"shortcut-{i}"), fresh(f"Shortcut number {i}"), fresh(f"<Control><Alt>F{i % 12 + 1}"))
+                 for i in range(per_session)]
+    return app_id, sender, handle, shortcuts
+
+def build_dicts(count, apps, per_session):
+    sessions = {}
+    for n in range(count // per_session):
+        app_id, sender, handle, shortcuts = session_strings(n, apps, per_session)
+        session = sessions[handle] = {'app_id': app_id, 'shortcuts': {}, 'sender': sender}
+        for s_id, description, trigger in shortcuts:
+            token = f"{n}-{s_id}"
+            session['shortcuts'][s_id] = {
+                'description': description,
+                'trigger_desc': trigger,
+                'token': token,
+                'registration': Registration(token),
+                'route': ActivationRoute(sender, app_id, handle, s_id)
+            }
+    return sessions
+
+def build_records(count, apps, per_session):
+    sessions = {}
+    for n in range(count // per_session):
+        app_id, sender, handle, shortcuts = session_strings(n, apps, per_session)
+        session = sessions[handle] = Session(app_id, sender)
+        for s_id, description, trigger in shortcuts:
+            route = ActivationRoute(session.sender, session.app_id, handle, s_id)
+            session.shortcuts[s_id] = Shortcut(description, trigger, Registration(f"{n}-{s_id}"), route)
+    return sessions
+
+def bytes_per_shortcut(build, count, apps, per_session):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = build(count, apps, per_session)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del sessions
+    return used / count
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per shortcut of the portal state")
+    parser.add_argument('--shortcuts', type=int, nargs='+', default=[10000, 100000], help="shortcut counts to measure")
+    parser.add_argument('--per-session', type=int, default=5, help="shortcuts in each session")
+    parser.add_argument('--apps', type=int, default=50, help="distinct app ids across the sessions")
+    parser.add_argument('--json', action='store_true', help="print a machine-readable report")
+    args = parser.parse_args()
+    if args.per_session < 1 or args.apps < 1:
+        parser.error("--per-session and --apps must be at least 1")
+
+    report = {}
+    for count in args.shortcuts:
+        for name, build in (('dicts', build_dicts), ('records', build_records)):
+            report[f'{name}_{count}'] = bytes_per_shortcut(build, count, args.apps, args.per_session)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, per_shortcut in report.items():
+        print(f"{name:<16} {per_shortcut:>10.1f} bytes/shortcut")
+
+if __name__ == "__main__":
+    sys.exit(main())
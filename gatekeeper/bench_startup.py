@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Compares startup cost of the headless daemon with the GTK-loaded mode.
+#
+# Each sample runs in a fresh interpreter that imports gatekeeper and creates
+# the application; the "gtk" mode additionally loads the GTK user interface,
+# which is what every start used to pay before the UI became lazy. Neither
+# mode connects to Wayland or D-Bus, so no compositor is needed.
+
+PROBE = """
+import os, resource, sys, time
+start = time.perf_counter()
+sys.argv = ['gatekeeper.py']
+import gatekeeper
+app = gatekeeper.GatekeeperApp()
+if {load_ui}:
+    app.load_ui()
+elapsed = time.perf_counter() - start
+rss_kb = 0
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb)
+"""
+
+MODES = {
+    'headless': False,
+    'gtk': True
+}
+
+def run_sample(load_ui):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(load_ui=load_ui)],
+        cwd=script_dir, check=True, capture_output=True, text=True
+    ).stdout
+    wall = time.perf_counter() - start
+    init, rss_kb = out.split()[-2:]
+    return float(init), wall, int(rss_kb)
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and RSS of gatekeeper modes")
+    parser.add_argument('-n', '--runs', type=int, default=10, help="samples per mode")
+    parser.add_argument('--json', action='store_true', help="print a machine-readable report")
+    args = parser.parse_args()
+
+    report = {}
+    for mode, load_ui in MODES.items():
+        try:
+            samples = [run_sample(load_ui) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{mode}: probe failed: {e.stderr.strip().splitlines()[-1]}", file=sys.stderr)
+            continue
+        report[mode] = {
+            'init_ms': statistics.median(s[0] for s in samples) * 1000,
+            'process_ms': statistics.median(s[1] for s in samples) * 1000,
+            'rss_kb': statistics.median(s[2] for s in samples)
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'mode':<10} {'init (ms)':>10} {'process (ms)':>13} {'RSS (KiB)':>10}")
+    for mode, r in report.items():
+        print(f"{mode:<10} {r['init_ms']:>10.1f} {r['process_ms']:>13.1f} {r['rss_kb']:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import logging
+import os
+
+from gi.repository import GLib
+
+logger = logging.getLogger("Gatekeeper")
+
+PORTAL_INTERFACE = "org.freedesktop.impl.portal.GlobalShortcuts"
+
+# Shortcut changes are gathered per session and sent as one ShortcutsChanged
+# signal. With a window of 0 the signals go out once the current main loop
+# iteration is done; otherwise changes made within GATEKEEPER_CHANGES_WINDOW_MS
+# of the first one are sent together.
+def changes_window_ms():
+    try:
+        return max(int(os.environ.get('GATEKEEPER_CHANGES_WINDOW_MS', '0')), 0)
+    except ValueError:
+        return 0
+
+class ChangeBatcher:
+    def __init__(self, connection, object_path, window_ms=None):
+        self.connection = connection
+        self.object_path = object_path
+        self.window_ms = changes_window_ms() if window_ms is None else window_ms
+        self.pending = {} # session_handle -> {shortcut_id: a{sv} dict}
+        self.source = None
+        self.emitted = 0
+        self.coalesced = 0
+
+    def add(self, session_handle, s_id, options):
+        # A later change of the same shortcut replaces the earlier one
+        changes = self.pending.setdefault(session_handle, {})
+        if changes:
+            # Rides along with a signal that is going out anyway
+            self.coalesced += 1
+        changes[s_id] = options
+        if self.source is None:
+            if self.window_ms:
+                self.source = GLib.timeout_add(self.window_ms, self.on_flush)
+            else:
+                self.source = GLib.idle_add(self.on_flush)
+
+    def forget(self, session_handle):
+        # Nobody is left to tell about the changes of a closed session
+        self.pending.pop(session_handle, None)
+
+    def on_flush(self):
+        self.source = None
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def flush(self):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+        pending, self.pending = self.pending, {}
+        for session_handle, changes in pending.items():
+            logger.debug("Emitting ShortcutsChanged for %d shortcuts of %s", len(changes), session_handle)
+            self.connection.emit_signal(
+                None,
+                self.object_path,
+                PORTAL_INTERFACE,
+                "ShortcutsChanged",
+                GLib.Variant("(oa(sa{sv}))", (session_handle, list(changes.items())))
+            )
+            self.emitted += 1
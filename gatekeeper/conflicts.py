@@ -0,0 +1,98 @@
+from gi.repository import GLib
+
+from accelerator import MOD_ALT, MOD_CTRL, MOD_META, MOD_SHIFT, format_accelerator
+
+# Who holds which trigger, so a conflict is known before asking the
+# compositor.
+#
+# Every (app_id, shortcut id) bound to a (modifiers, keysym) is an owner of
+# it. The TriggerPool lets owners share one compositor trigger, so another
+# owner is a conflict to point out to the user rather than an error. A
+# trigger the compositor refused is held by a client outside gatekeeper;
+# it is not requested again for REFUSED_TTL_US, as that would fail the same
+# way.
+
+REFUSED_TTL_US = 30 * 1000000
+
+# Modifiers added to a taken trigger to find free alternatives, in order
+ALTERNATIVE_MODIFIERS = (
+    MOD_CTRL | MOD_ALT, MOD_CTRL | MOD_SHIFT, MOD_ALT | MOD_SHIFT, MOD_META,
+    MOD_META | MOD_SHIFT, MOD_CTRL | MOD_ALT | MOD_SHIFT, MOD_META | MOD_CTRL
+)
+
+class ConflictIndex:
+    def __init__(self):
+        self.owners = {} # (modifiers, keysym) -> {(app_id, shortcut_id): count}
+        self.refused = {} # (modifiers, keysym) -> monotonic time it may be retried
+
+    def add(self, key, app_id, s_id):
+        owners = self.owners.setdefault(key, {})
+        owners[(app_id, s_id)] = owners.get((app_id, s_id), 0) + 1
+
+    def remove(self, key, app_id, s_id):
+        owners = self.owners.get(key)
+        if owners is None:
+            return
+        count = owners.get((app_id, s_id), 0) - 1
+        if count > 0:
+            owners[(app_id, s_id)] = count
+            return
+        owners.pop((app_id, s_id), None)
+        if not owners:
+            del self.owners[key]
+
+    def conflicts(self, key, app_id, s_id):
+        # The other shortcuts bound to key
+        owners = self.owners.get(key)
+        if not owners:
+            return []
+        return [owner for owner in owners if owner != (app_id, s_id)]
+
+    def mark_refused(self, key):
+        self.refused[key] = GLib.get_monotonic_time() + REFUSED_TTL_US
+
+    def clear_refused(self, key):
+        self.refused.pop(key, None)
+
+    def is_refused(self, key):
+        until = self.refused.get(key)
+        if until is None:
+            return False
+        if GLib.get_monotonic_time() < until:
+            return True
+        del self.refused[key]
+        return False
+
+    def is_free(self, key):
+        return key not in self.owners and not self.is_refused(key)
+
+    def suggest(self, key, count=3):
+        # Free triggers on the same key with more modifiers held
+        mods, keysym = key
+        suggestions = []
+        for extra in ALTERNATIVE_MODIFIERS:
+            candidate = (mods | extra, keysym)
+            if candidate != key and self.is_free(candidate):
+                suggestion = format_accelerator(*candidate)
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+                    if len(suggestions) == count:
+                        break
+        return suggestions
+
+    def describe(self, key, app_id, s_id):
+        # A message about what stands in the way of binding key, or None
+        if self.is_refused(key):
+            message = "Taken by another application"
+        else:
+            others = self.conflicts(key, app_id, s_id)
+            if not others:
+                return None
+            owner_app, owner_shortcut = others[0]
+            message = f"Also used by {owner_app} ({owner_shortcut})"
+            if len(others) > 1:
+                message += f" and {len(others) - 1} more"
+        suggestions = self.suggest(key)
+        if suggestions:
+            message += "; free: " + ", ".join(suggestions)
+        return message
@@ -0,0 +1,182 @@
+import collections
+import logging
+
+from gi.repository import GLib, Gio
+
+import tracing
+from tracing import tracer
+
+logger = logging.getLogger("Gatekeeper")
+
+CLIENT_INTERFACE = "org.freedesktop.portal.GlobalShortcuts"
+ACTIVATED = "Activated"
+DEACTIVATED = "Deactivated"
+
+# Activated/Deactivated message parts that do not depend on the event
+EMPTY_OPTIONS = GLib.Variant('a{sv}', {})
+# With tracing enabled, the options carry the monotonic time (microseconds)
+# at which gatekeeper received the compositor event, so clients can measure
+# delivery latency
+RECEIVED_TIME_OPTION = "received_time_us"
+
+# A client gets at most MAX_IN_FLIGHT unanswered calls; anything beyond that
+# waits in a queue of at most QUEUE_LIMIT events. Calls time out after
+# DELIVERY_TIMEOUT_MS instead of holding a reply slot forever.
+DELIVERY_TIMEOUT_MS = 500
+MAX_IN_FLIGHT = 4
+QUEUE_LIMIT = 32
+# Queued events older than this are no longer worth delivering
+STALE_AFTER_US = 1000000
+# Deliveries answered later than this (from the compositor event) are late
+LATE_AFTER_US = 50000
+
+class PendingEvent:
+    __slots__ = ('route', 'method', 'time', 'received_at')
+
+    def __init__(self, route, method, time, received_at):
+        self.route = route
+        self.method = method
+        self.time = time
+        self.received_at = received_at
+
+class ClientChannel:
+    __slots__ = ('sender', 'queue', 'in_flight', 'delivered', 'dropped', 'coalesced', 'late', 'failed')
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.queue = collections.deque()
+        self.in_flight = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.late = 0
+        self.failed = 0
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'in_flight': self.in_flight,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'late': self.late,
+            'failed': self.failed
+        }
+
+class ActivationDelivery:
+    # Sends Activated/Deactivated calls to clients asynchronously with a
+    # bounded timeout. Each client has its own channel so a hung client only
+    # ever fills its own queue and never delays delivery to the others.
+    def __init__(self, connection):
+        self.connection = connection
+        self.channels = {} # sender -> ClientChannel
+
+    def send(self, route, method, time):
+        channel = self.channels.get(route.sender)
+        if channel is None:
+            channel = self.channels[route.sender] = ClientChannel(route.sender)
+        event = PendingEvent(route, method, time, GLib.get_monotonic_time())
+        if channel.in_flight < MAX_IN_FLIGHT and not channel.queue:
+            self.call(channel, event)
+        else:
+            self.enqueue(channel, event)
+
+    def enqueue(self, channel, event):
+        queue = channel.queue
+        if event.method == ACTIVATED:
+            # Key-repeat storm: a begin/end pair for the same route that is
+            # still waiting is superseded by this new begin.
+            pair = self.find_last_pair(queue, event.route)
+            if pair:
+                for queued in pair:
+                    queue.remove(queued)
+                channel.coalesced += 2
+        queue.append(event)
+        while len(queue) > QUEUE_LIMIT:
+            self.drop(channel, queue[0])
+
+    def find_last_pair(self, queue, route):
+        end = None
+        for queued in reversed(queue):
+            if queued.route is not route:
+                continue
+            if end is None:
+                if queued.method != DEACTIVATED:
+                    return None
+                end = queued
+            else:
+                return (queued, end) if queued.method == ACTIVATED else None
+        return None
+
+    def drop(self, channel, event):
+        # Dropping a begin also drops the end that closes it so the client
+        # never sees an unbalanced pair.
+        queue = channel.queue
+        queue.remove(event)
+        channel.dropped += 1
+        if event.method == ACTIVATED:
+            for queued in queue:
+                if queued.route is event.route:
+                    if queued.method == DEACTIVATED:
+                        queue.remove(queued)
+                        channel.dropped += 1
+                    break
+
+    def pump(self, channel):
+        queue = channel.queue
+        now = GLib.get_monotonic_time()
+        while queue and channel.in_flight < MAX_IN_FLIGHT:
+            event = queue[0]
+            if now - event.received_at > STALE_AFTER_US:
+                self.drop(channel, event)
+                continue
+            queue.popleft()
+            self.call(channel, event)
+
+    def call(self, channel, event):
+        route = event.route
+        channel.in_flight += 1
+        options = EMPTY_OPTIONS
+        if tracer.enabled:
+            tracer.record(tracing.ACTIVATED_SENT if event.method == ACTIVATED else tracing.DEACTIVATED_SENT, route.shortcut_id)
+            options = GLib.Variant('a{sv}', {RECEIVED_TIME_OPTION: GLib.Variant('x', event.received_at)})
+        self.connection.call(
+            channel.sender,
+            route.session_handle,
+            CLIENT_INTERFACE,
+            event.method,
+            GLib.Variant.new_tuple(route.shortcut_id_variant, GLib.Variant.new_uint32(event.time), options),
+            None,
+            Gio.DBusCallFlags.NO_AUTO_START,
+            DELIVERY_TIMEOUT_MS,
+            None,
+            self.on_call_done,
+            (channel, event)
+        )
+
+    def on_call_done(self, connection, result, data):
+        channel, event = data
+        channel.in_flight -= 1
+        try:
+            connection.call_finish(result)
+            channel.delivered += 1
+            now = GLib.get_monotonic_time()
+            if now - event.received_at > LATE_AFTER_US:
+                channel.late += 1
+            if tracer.enabled and event.method == ACTIVATED:
+                tracer.record(tracing.ACTIVATED_DELIVERED, event.route.shortcut_id, now)
+                tracer.latency(tracing.ACTIVATION, event.received_at, now)
+        except GLib.Error as e:
+            channel.failed += 1
+            logger.warning("%s for %s to %s failed: %s", event.method, event.route.shortcut_id, channel.sender, e.message)
+        if self.channels.get(channel.sender) is channel:
+            self.pump(channel)
+
+    def forget(self, sender):
+        channel = self.channels.pop(sender, None)
+        if channel:
+            channel.dropped += len(channel.queue)
+            channel.queue.clear()
+
+    def stats(self):
+        return {sender: channel.stats() for sender, channel in self.channels.items()}
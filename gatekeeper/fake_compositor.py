@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+from pywayland import ffi, lib
+from pywayland.protocol_core import ArgumentType
+from pywayland.server import Display
+from pywayland.server.eventloop import EventLoop
+
+# Add current directory to path to find generated protocols
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from protocols.ext_input_trigger_registration_v1 import (
+        ExtInputTriggerRegistrationManagerV1, ExtInputTriggerV1, ExtInputTriggerActionControlV1)
+    from protocols.ext_input_trigger_action_v1 import ExtInputTriggerActionManagerV1, ExtInputTriggerActionV1
+except ImportError:
+    print("Error: Could not import generated protocols. Please run generate_protocols.py first.")
+    sys.exit(1)
+
+# A stand-in for Mir that implements just the input trigger protocols, so
+# gatekeeper can be run and measured without a real compositor.
+#
+# Triggers are reserved per (modifiers, key) like the real compositor does:
+# a second registration of a combination that is still held fails. Replies
+# can be delayed with --latency-ms. Key presses are injected by writing
+# commands to stdin, or to the FIFO given with --commands, one per line:
+#
+#   begin TOKEN | end TOKEN | press TOKEN | press-all | latency MS
+#
+# "press" sends begin and end. The compositor exits when stdin is closed; a
+# --commands FIFO is held open for writing here too, so it neither blocks
+# until a writer appears nor ends when one goes away. Once the socket is
+# listening, "ready SOCKET" is printed on stdout.
+
+CAPABILITY_KEYBOARD = 1
+
+def convert_requests(interface, resources):
+    # pywayland's server side cannot convert new_id and object request
+    # arguments; they are passed on as the new object id and the resource
+    # created here for it.
+    def make_converter(message):
+        def c_to_arguments(c_args):
+            args = []
+            for i, argument in enumerate(message.arguments):
+                arg = c_args[i]
+                kind = argument.argument_type
+                if kind == ArgumentType.NewId:
+                    args.append(arg.n)
+                elif kind == ArgumentType.Uint:
+                    args.append(arg.u)
+                elif kind == ArgumentType.Int:
+                    args.append(arg.i)
+                elif kind == ArgumentType.String:
+                    args.append(ffi.string(arg.s).decode() if arg.s != ffi.NULL else None)
+                elif kind == ArgumentType.Object:
+                    args.append(resources.get(int(ffi.cast("uintptr_t", arg.o))))
+                else:
+                    raise NotImplementedError(f"{message.name}: {kind}")
+            return args
+        return c_to_arguments
+    for message in interface.requests:
+        message.c_to_arguments = make_converter(message)
+
+class FakeCompositor:
+    def __init__(self, socket_name, latency_ms=0, verbose=False, commands_path=None):
+        self.display = Display()
+        self.socket_name = self.display.add_socket(socket_name)
+        self.loop = self.display.get_event_loop()
+        self.latency_ms = latency_ms
+        self.verbose = verbose
+        self.resources = {} # wl_resource address -> Python resource
+        self.reserved = {} # (kind, modifiers, key) -> trigger resource
+        self.actions = {} # token -> [action resources]
+        self.controls = {} # token -> action control resource
+        self.next_token = 0
+        self.timers = set()
+        self.input_buffer = b''
+        self.started = time.monotonic()
+
+        for interface in (ExtInputTriggerRegistrationManagerV1, ExtInputTriggerV1,
+                          ExtInputTriggerActionControlV1, ExtInputTriggerActionManagerV1,
+                          ExtInputTriggerActionV1):
+            convert_requests(interface, self.resources)
+        self.registration_global = ExtInputTriggerRegistrationManagerV1.global_class(self.display)
+        self.registration_global.bind_func = self.bind_registration_manager
+        self.action_global = ExtInputTriggerActionManagerV1.global_class(self.display)
+        self.action_global.bind_func = self.bind_action_manager
+        if commands_path:
+            self.commands_fd = os.open(commands_path, os.O_RDWR | os.O_NONBLOCK)
+        else:
+            self.commands_fd = sys.stdin.fileno()
+        self.commands_source = self.loop.add_fd(self.commands_fd, self.on_commands, EventLoop.FdMask.WL_EVENT_READABLE, None)
+
+    def log(self, message):
+        if self.verbose:
+            print(message, file=sys.stderr, flush=True)
+
+    def adopt(self, resource):
+        # pywayland does not pass the resource handle to the dispatcher for
+        # resources created from Python; install it again so requests arrive
+        lib.wl_resource_set_dispatcher(resource._ptr, lib.dispatcher_func, resource._handle,
+                                       resource._handle, lib.resource_destroy_func)
+        address = int(ffi.cast("uintptr_t", resource._ptr))
+        self.resources[address] = resource
+        resource.alive = True
+
+        def on_destroyed(res):
+            res.alive = False
+            self.resources.pop(address, None)
+            self.on_resource_destroyed(res)
+        resource.dispatcher.destructor = on_destroyed
+        return resource
+
+    def create(self, parent, interface, new_id):
+        client = lib.wl_resource_get_client(parent._ptr)
+        return self.adopt(interface.resource_class(client, parent.version, new_id))
+
+    def later(self, func, *args):
+        if not self.latency_ms:
+            func(*args)
+            return
+
+        def fire(data):
+            self.timers.discard(source)
+            source.remove()
+            func(*args)
+            return 0
+        source = self.loop.add_timer(fire, None)
+        self.timers.add(source)
+        source.timer_update(self.latency_ms)
+
+    def now_ms(self):
+        return int((time.monotonic() - self.started) * 1000) & 0xffffffff
+
+    # ext_input_trigger_registration_manager_v1
+
+    def bind_registration_manager(self, resource):
+        self.adopt(resource)
+        resource.dispatcher['register_keyboard_sym_trigger'] = self.on_register_sym
+        resource.dispatcher['register_keyboard_code_trigger'] = self.on_register_code
+        resource.dispatcher['get_action_control'] = self.on_get_action_control
+        resource.dispatcher['destroy'] = self.on_destroy
+        resource.capabilities(CAPABILITY_KEYBOARD)
+
+    def on_register_sym(self, manager, modifiers, keysym, new_id):
+        self.register_trigger(manager, ('sym', modifiers, keysym), new_id)
+
+    def on_register_code(self, manager, modifiers, keycode, new_id):
+        self.register_trigger(manager, ('code', modifiers, keycode), new_id)
+
+    def register_trigger(self, manager, key, new_id):
+        trigger = self.create(manager, ExtInputTriggerV1, new_id)
+        trigger.dispatcher['destroy'] = self.on_destroy
+        trigger.key = None
+        self.log(f"register {key}")
+        if not key[2] or key in self.reserved:
+            self.log(f"failed {key}")
+            self.later(self.send_failed, trigger)
+            return
+        trigger.key = key
+        self.reserved[key] = trigger
+        self.later(self.send_done, trigger)
+
+    def send_done(self, trigger):
+        if trigger.alive:
+            trigger.done()
+
+    def send_failed(self, trigger):
+        if trigger.alive:
+            trigger.failed()
+
+    def on_get_action_control(self, manager, name, new_id):
+        control = self.create(manager, ExtInputTriggerActionControlV1, new_id)
+        control.dispatcher['add_input_trigger_event'] = lambda control, trigger: None
+        control.dispatcher['drop_input_trigger_event'] = lambda control, trigger: None
+        control.dispatcher['cancel'] = self.on_cancel
+        control.dispatcher['destroy'] = self.on_destroy
+        self.next_token += 1
+        control.token = f"token-{self.next_token}"
+        self.controls[control.token] = control
+        self.later(self.send_token, control)
+
+    def send_token(self, control):
+        self.log(f"token {control.token}")
+        if control.token in self.controls:
+            control.done(control.token)
+
+    def send_unavailable(self, action):
+        if action.alive:
+            action.unavailable()
+
+    def on_cancel(self, control):
+        for action in self.actions.pop(control.token, []):
+            action.unavailable()
+        control.destroy()
+
+    def on_destroy(self, resource):
+        resource.destroy()
+
+    def on_resource_destroyed(self, resource):
+        key = getattr(resource, 'key', None)
+        if key is not None and self.reserved.get(key) is resource:
+            del self.reserved[key]
+        token = getattr(resource, 'token', None)
+        if token is None:
+            return
+        if self.controls.get(token) is resource:
+            del self.controls[token]
+        actions = self.actions.get(token)
+        if actions and resource in actions:
+            actions.remove(resource)
+
+    # ext_input_trigger_action_manager_v1
+
+    def bind_action_manager(self, resource):
+        self.adopt(resource)
+        resource.dispatcher['get_input_trigger_action'] = self.on_get_action
+        resource.dispatcher['destroy'] = self.on_destroy
+
+    def on_get_action(self, manager, token, new_id):
+        self.log(f"action {token}")
+        action = self.create(manager, ExtInputTriggerActionV1, new_id)
+        action.dispatcher['destroy'] = self.on_destroy
+        action.token = token
+        if token not in self.controls:
+            self.later(self.send_unavailable, action)
+            return
+        self.actions.setdefault(token, []).append(action)
+
+    # Control commands
+
+    def on_commands(self, fd, mask, data):
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return 0
+        if not chunk:
+            self.commands_source.remove()
+            self.display.terminate()
+            return 0
+        self.input_buffer += chunk
+        *lines, self.input_buffer = self.input_buffer.split(b'\n')
+        for line in lines:
+            self.run_command(line.decode().split())
+        self.display.flush_clients()
+        return 0
+
+    def run_command(self, words):
+        if not words:
+            return
+        command, args = words[0], words[1:]
+        if command in ('begin', 'end', 'press') and args:
+            for token in args:
+                self.activate(token, command)
+        elif command == 'press-all':
+            for token in list(self.actions):
+                self.activate(token, 'press')
+        elif command == 'latency' and args:
+            self.latency_ms = int(args[0])
+        else:
+            print(f"unknown command: {' '.join(words)}", file=sys.stderr, flush=True)
+
+    def activate(self, token, command):
+        now = self.now_ms()
+        for action in self.actions.get(token, []):
+            if command in ('begin', 'press'):
+                action.begin(now, token)
+            if command in ('end', 'press'):
+                action.end(now, token)
+
+    def run(self):
+        print(f"ready {self.socket_name}", flush=True)
+        self.display.run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake compositor implementing the input trigger protocols")
+    parser.add_argument('--socket', default='gatekeeper-test-0', help="Wayland socket name")
+    parser.add_argument('--latency-ms', type=int, default=0, help="delay before every reply")
+    parser.add_argument('--commands', help="FIFO to read commands from instead of stdin")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log requests to stderr")
+    args = parser.parse_args()
+    FakeCompositor(args.socket, args.latency_ms, args.verbose, args.commands).run()
+
+if __name__ == "__main__":
+    main()
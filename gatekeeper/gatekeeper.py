@@ -1,28 +1,45 @@
 #!/usr/bin/env python3
 import sys
 import os
-import gi
+import enum
 import logging
 
-gi.require_version('Gtk', '4.0')
-from gi.repository import Gtk, GLib, Gio, Gdk
+from gi.repository import GLib, Gio
 
 from pywayland.client import Display
-from pywayland.protocol.wayland import WlRegistry
+from pywayland.protocol.wayland import WlRegistry, WlSeat
 
 # Add current directory to path to find generated protocols
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from protocols.ext_input_trigger_registration_v1 import ExtInputTriggerRegistrationManagerV1
-    from protocols.ext_input_trigger_action_v1 import ExtInputTriggerActionManagerV1, ExtInputTriggerActionV1
+    from protocols.ext_input_trigger_action_v1 import ExtInputTriggerActionManagerV1
 except ImportError:
     print("Error: Could not import generated protocols. Please run generate_protocols.py first.")
     sys.exit(1)
 
-# Setup logging - Updated to DEBUG for verbose output
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from wayland_source import WaylandSource
+from delivery import ActivationDelivery, ACTIVATED, DEACTIVATED
+from store import ShortcutStore
+from accelerator import TRIGGER_KIND_CODE, TRIGGER_KIND_SYM, parse_accelerator, parse_accelerators, preferred_trigger, split_trigger
+import tracing
+from tracing import tracer
+from stats import GatekeeperStats
+from policy import ApprovalPolicy
+from conflicts import ConflictIndex
+from changes import ChangeBatcher
+from records import ActivationRoute, Session, Shortcut
+from scheduler import BindScheduler
+from keymap import KeycodeMap, XKB_KEYMAP_FORMAT_TEXT_V1, read_keymap
+
+# Setup logging - set GATEKEEPER_LOG_LEVEL=DEBUG for verbose output
+LOG_LEVEL = os.environ.get('GATEKEEPER_LOG_LEVEL', 'INFO').upper()
+LOG_LEVEL_VALID = isinstance(logging.getLevelName(LOG_LEVEL), int)
+logging.basicConfig(level=LOG_LEVEL if LOG_LEVEL_VALID else logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("Gatekeeper")
+if not LOG_LEVEL_VALID:
+    logger.warning(f"Unknown GATEKEEPER_LOG_LEVEL {LOG_LEVEL!r}; logging at INFO")
 
 # DBus Interface XML
 GLOBAL_SHORTCUTS_XML = """
@@ -59,170 +76,442 @@ GLOBAL_SHORTCUTS_XML = """
 </node>
 """
 
-# Minimal Keysym definitions (XKB)
-KEY_A = 0x0061
-# ... add more as needed
-
-MOD_SHIFT = 0x08
-MOD_CTRL = 0x100
-MOD_ALT = 0x01
-MOD_META = 0x800
-
-def parse_accelerator(accel_string):
-    mods = 0
-    keyval = 0
-    valid, keyval, modifiers = Gtk.accelerator_parse(accel_string)
-    if not valid:
-        return 0, 0
-    if modifiers & Gdk.ModifierType.SHIFT_MASK:
-        mods |= MOD_SHIFT
-    if modifiers & Gdk.ModifierType.CONTROL_MASK:
-        mods |= MOD_CTRL
-    if modifiers & Gdk.ModifierType.ALT_MASK:
-        mods |= MOD_ALT
-    if modifiers & Gdk.ModifierType.META_MASK:
-        mods |= MOD_META
-    return mods, keyval
-
-class ShortcutDialog(Gtk.Dialog):
-    def __init__(self, parent, shortcuts):
-        super().__init__(title="Register Shortcuts", transient_for=parent, modal=True)
-        self.shortcuts = shortcuts
-        self.entries = {}
-
-        box = self.get_content_area()
-        box.set_spacing(10)
-        box.set_margin_top(10)
-        box.set_margin_bottom(10)
-        box.set_margin_start(10)
-        box.set_margin_end(10)
-
-        lbl = Gtk.Label(label="An application wants to register the following shortcuts:")
-        box.append(lbl)
-
-        grid = Gtk.Grid()
-        grid.set_row_spacing(6)
-        grid.set_column_spacing(12)
-        box.append(grid)
-
-        for i, (s_id, options) in enumerate(shortcuts):
-            desc = options.get('description', s_id)
-            grid.attach(Gtk.Label(label=desc, xalign=0), 0, i, 1, 1)
-            entry = Gtk.Entry()
-            entry.set_placeholder_text("<Control>a")
-            preferred = options.get('preferred_trigger', '')
-            if preferred:
-                entry.set_text(preferred)
-            self.entries[s_id] = entry
-            grid.attach(entry, 1, i, 1, 1)
-
-        self.add_button("Cancel", Gtk.ResponseType.CANCEL)
-        self.add_button("Register", Gtk.ResponseType.OK)
-
-    def get_triggers(self):
-        triggers = {}
-        for s_id, entry in self.entries.items():
-            text = entry.get_text()
-            if text:
-                triggers[s_id] = text
-        return triggers
-
-class GatekeeperWindow(Gtk.ApplicationWindow):
-    def __init__(self, app):
-        super().__init__(application=app, title="Gatekeeper")
-        self.app = app
-        self.set_default_size(600, 400)
-        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-        self.set_child(box)
-        header = Gtk.HeaderBar()
-        self.set_titlebar(header)
-        label = Gtk.Label(label="Registered Shortcuts")
-        label.set_margin_top(10)
-        box.append(label)
-        self.list_box = Gtk.ListBox()
-        self.list_box.set_selection_mode(Gtk.SelectionMode.NONE)
-        scrolled = Gtk.ScrolledWindow()
-        scrolled.set_child(self.list_box)
-        scrolled.set_vexpand(True)
-        box.append(scrolled)
-        self.refresh_list()
-
-    def refresh_list(self):
-        while child := self.list_box.get_first_child():
-            self.list_box.remove(child)
-
-        for session_path, session in self.app.portal.sessions.items():
-            app_id = session['app_id']
-            for s_id, s_data in session['shortcuts'].items():
-                row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
-                row.set_margin_start(10)
-                row.set_margin_end(10)
-                row.set_margin_top(5)
-                row.set_margin_bottom(5)
-                info_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-                info_box.append(Gtk.Label(label=f"<b>{s_data.get('description', s_id)}</b>", use_markup=True, xalign=0))
-                info_box.append(Gtk.Label(label=f"<small>{app_id} ({s_id})</small>", use_markup=True, xalign=0))
-                info_box.set_hexpand(True)
-                row.append(info_box)
-                trigger_desc = s_data.get('trigger_desc', 'None')
-                row.append(Gtk.Label(label=trigger_desc))
-                edit_btn = Gtk.Button(label="Edit")
-                edit_btn.connect("clicked", self.on_edit_clicked, session_path, s_id)
-                row.append(edit_btn)
-                self.list_box.append(row)
-
-    def on_edit_clicked(self, btn, session_path, s_id):
-        session = self.app.portal.sessions.get(session_path)
-        if not session: return
-        s_data = session['shortcuts'].get(s_id)
-        if not s_data: return
-        dialog = Gtk.Dialog(title="Edit Shortcut", transient_for=self, modal=True)
-        dialog.add_button("Cancel", Gtk.ResponseType.CANCEL)
-        dialog.add_button("Save", Gtk.ResponseType.OK)
-        content = dialog.get_content_area()
-        content.set_spacing(10)
-        content.set_margin_top(10)
-        content.set_margin_bottom(10)
-        content.set_margin_start(10)
-        content.set_margin_end(10)
-        entry = Gtk.Entry()
-        entry.set_text(s_data.get('trigger_desc', ''))
-        content.append(Gtk.Label(label=f"New trigger for {s_data.get('description', s_id)}:"))
-        content.append(entry)
-        dialog.connect("response", self.on_edit_response, session_path, s_id, entry)
-        dialog.show()
+REQUEST_XML = """
+<node>
+  <interface name="org.freedesktop.impl.portal.Request">
+    <method name="Close"/>
+  </interface>
+</node>
+"""
 
-    def on_edit_response(self, dialog, response_id, session_path, s_id, entry):
-        dialog.destroy()
-        if response_id == Gtk.ResponseType.OK:
-            new_trigger = entry.get_text()
-            self.app.update_shortcut(session_path, s_id, new_trigger)
+SESSION_XML = """
+<node>
+  <interface name="org.freedesktop.impl.portal.Session">
+    <method name="Close"/>
+    <signal name="Closed"/>
+  </interface>
+</node>
+"""
+
+SESSION_INTERFACE = "org.freedesktop.impl.portal.Session"
+ERROR_ACCESS_DENIED = "org.freedesktop.DBus.Error.AccessDenied"
+
+# ext_input_trigger_registration_manager_v1.capability
+CAPABILITY_KEYBOARD = 0x01
+
+def trigger_entries(trigger):
+    # How a trigger is shown to clients: the accelerator without the
+    # internal "code:" prefix, and whether it is bound to the physical key
+    accel, by_code = split_trigger(trigger)
+    return {
+        'trigger_description': GLib.Variant('s', accel),
+        'trigger_kind': GLib.Variant('s', TRIGGER_KIND_CODE if by_code else TRIGGER_KIND_SYM)
+    }
+
+# Delays between attempts to reconnect to the compositor, doubling from the
+# first to the last
+RECONNECT_MIN_DELAY_MS = 100
+RECONNECT_MAX_DELAY_MS = 5000
+
+def accept_preferred_triggers(session_handle, shortcuts):
+    # What ShortcutDialog returns when it is accepted without edits
+    return {s_id: preferred_trigger(options) for s_id, options in shortcuts if options.get('preferred_trigger')}
+
+class PendingBind:
+    # A BindShortcuts call that has not been answered, exported at its
+    # request handle so the caller can Close it. batch is the registration
+    # batch in flight for it, if any.
+    __slots__ = ('request_handle', 'session_handle', 'sender', 'object_id', 'batch')
+
+    def __init__(self, request_handle, session_handle, sender):
+        self.request_handle = request_handle
+        self.session_handle = session_handle
+        self.sender = sender # unique name of the caller, the only one that may Close it
+        self.object_id = 0
+        self.batch = None
 
 class GlobalShortcutsPortal:
     def __init__(self, app):
         self.app = app
-        self.sessions = {} # session_handle -> { 'app_id': str, 'shortcuts': dict, 'sender': str }
+        self.sessions = {} # session_handle -> Session
+        self.by_sender = {} # sender -> set of session handles
+        # session_handle -> serialized a(sa{sv}) listing, dropped whenever
+        # the session's shortcuts change
+        self.listings = {}
 
     # [CHANGE] Added sender argument
     def CreateSession(self, request_handle, session_handle, app_id, options, sender):
         logger.info(f"CreateSession: {session_handle} for {app_id} (Sender: {sender})")
-        self.sessions[session_handle] = {
-            'app_id': app_id,
-            'shortcuts': {},
-            'sender': sender  # [CHANGE] Store the sender
-        }
-        return 0, {}
+        self.sessions[session_handle] = Session(app_id, sender)  # [CHANGE] Store the sender
+        self.by_sender.setdefault(sender, set()).add(session_handle)
+        self.invalidate(session_handle)
+        # What kinds of triggers can be bound, as last announced by the compositor
+        return 0, {'capabilities': GLib.Variant('u', self.app.capabilities or 0)}
+
+    def remove_session(self, session_handle):
+        session = self.sessions.pop(session_handle, None)
+        if session is None:
+            return None
+        handles = self.by_sender.get(session.sender)
+        if handles is not None:
+            handles.discard(session_handle)
+            if not handles:
+                del self.by_sender[session.sender]
+        self.invalidate(session_handle)
+        return session
 
     def ListShortcuts(self, request_handle, session_handle):
-        if session_handle not in self.sessions:
+        listing = self.listing(session_handle)
+        if listing is None:
             return 2, {}
-        shortcuts = self.sessions[session_handle]['shortcuts']
+        return 0, {'shortcuts': listing}
+
+    def listing(self, session_handle):
+        listing = self.listings.get(session_handle)
+        if listing is not None:
+            return listing
+        session = self.sessions.get(session_handle)
+        if session is None:
+            return None
         result_shortcuts = []
-        for s_id, s_data in shortcuts.items():
-            result_shortcuts.append((s_id, {'description': GLib.Variant('s', s_data.get('description', ''))}))
-        return 0, {'shortcuts': GLib.Variant('a(sa{sv})', result_shortcuts)}
+        for s_id, shortcut in session.shortcuts.items():
+            entry = trigger_entries(shortcut.trigger_desc)
+            entry['description'] = GLib.Variant('s', shortcut.description)
+            if shortcut.registration is not None:
+                entry['trigger_action_token'] = GLib.Variant('s', shortcut.token)
+            result_shortcuts.append((s_id, entry))
+        listing = self.listings[session_handle] = GLib.Variant('a(sa{sv})', result_shortcuts)
+        return listing
+
+    def listings_for(self, session_handles):
+        # Listings of several sessions at once, all of them if none are given
+        handles = session_handles or self.sessions.keys()
+        listings = {}
+        for session_handle in handles:
+            listing = self.listing(session_handle)
+            if listing is not None:
+                listings[session_handle] = listing
+        return listings
 
-class GatekeeperApp(Gtk.Application):
+    def invalidate(self, session_handle):
+        self.listings.pop(session_handle, None)
+
+class RegistrationState(enum.Enum):
+    PENDING = "pending"                   # trigger and action control requested
+    TRIGGER_OWNED = "trigger-owned"       # trigger done, waiting for the token
+    TOKEN_RECEIVED = "token-received"     # token received, waiting for the trigger
+    ACTION_REQUESTED = "action-requested" # action requested, waiting for the batch sync
+    BOUND = "bound"
+    FAILED = "failed"
+
+SETTLED_STATES = (RegistrationState.ACTION_REQUESTED, RegistrationState.BOUND, RegistrationState.FAILED)
+
+class TriggerRegistration:
+    # One physical trigger registered with the compositor, shared through the
+    # TriggerPool by every (session, shortcut) bound to it. Its Wayland
+    # objects are driven purely from dispatched events, so nothing waits on a
+    # roundtrip. Begin/end events fan out to every route in self.routes.
+    __slots__ = ('pool', 'app', 'key', 'by_code', 'description', 'trigger_str', 'state', 'refused', 'trigger',
+                 'action_control', 'action', 'token', 'refs', 'routes', 'waiters')
+
+    def __init__(self, pool, key, by_code, description, trigger_str):
+        self.pool = pool
+        self.app = pool.app
+        self.key = key # (modifiers, keysym)
+        self.by_code = by_code # registered by the keycode of the keysym
+        self.description = description
+        self.trigger_str = trigger_str
+        self.state = RegistrationState.PENDING
+        # The compositor answered with failed, as opposed to a failure here
+        self.refused = False
+        self.trigger = None
+        self.action_control = None
+        self.action = None
+        self.token = None
+        self.refs = 0
+        self.routes = []
+        self.waiters = []
+
+    def settled(self):
+        return self.state in SETTLED_STATES
+
+    def start(self):
+        trigger_manager = self.app.trigger_manager
+        if not trigger_manager or not self.app.action_manager:
+            logger.error("Input trigger protocols not available")
+            self.fail()
+            return
+
+        mods, keyval = self.key
+        if not keyval:
+            logger.error(f"Invalid trigger '{self.trigger_str}'")
+            self.fail()
+            return
+        unsupported = self.app.unsupported_reason(self.key)
+        if unsupported:
+            logger.warning(f"Not registering '{self.trigger_str}': {unsupported}")
+            self.fail()
+            return
+        if self.app.conflicts.is_refused(self.key):
+            logger.warning(f"Trigger '{self.trigger_str}' is held by another application")
+            self.fail()
+            return
+        if self.by_code:
+            # The keycode is known once the seat has sent its keymap
+            self.app.keycodes.when_ready(self.start_code)
+            return
+        logger.debug("[Wayland] Registering trigger '%s'. Mods: %#x, Key: %#x", self.trigger_str, mods, keyval)
+        self.request_trigger(trigger_manager.register_keyboard_sym_trigger(mods, keyval))
+
+    def start_code(self):
+        if self.state != RegistrationState.PENDING or self.pool.triggers.get(self.pool_key()) is not self:
+            # Released or disconnected while waiting for the keymap
+            return
+        trigger_manager = self.app.trigger_manager
+        mods, keyval = self.key
+        keycode = self.app.keycodes.lookup(keyval)
+        if keycode is None:
+            logger.error(f"No key produces '{self.trigger_str}' in the current keymap")
+            self.fail()
+            return
+        logger.debug("[Wayland] Registering trigger '%s'. Mods: %#x, Keycode: %d", self.trigger_str, mods, keycode)
+        self.request_trigger(trigger_manager.register_keyboard_code_trigger(mods, keycode))
+
+    def pool_key(self):
+        return self.key, self.by_code
+
+    def request_trigger(self, trigger):
+        trigger_manager = self.app.trigger_manager
+        self.trigger = trigger
+        self.trigger.dispatcher['done'] = self.on_trigger_done
+        self.trigger.dispatcher['failed'] = self.on_trigger_failed
+
+        # The action control does not have to wait for the trigger to be
+        # confirmed; if the trigger fails both are destroyed again.
+        self.action_control = trigger_manager.get_action_control(self.description)
+        self.action_control.dispatcher['done'] = self.on_action_control_done
+        self.action_control.add_input_trigger_event(self.trigger)
+
+    def on_trigger_done(self, trigger):
+        if tracer.enabled:
+            tracer.record(tracing.TRIGGER_DONE, self.trigger_str)
+        self.app.conflicts.clear_refused(self.key)
+        if self.state == RegistrationState.PENDING:
+            self.state = RegistrationState.TRIGGER_OWNED
+        elif self.state == RegistrationState.TOKEN_RECEIVED:
+            self.request_action()
+
+    def on_trigger_failed(self, trigger):
+        logger.error(f"[Wayland] Trigger registration failed for '{self.trigger_str}'")
+        self.app.conflicts.mark_refused(self.key)
+        self.refused = True
+        self.fail()
+
+    def on_action_control_done(self, action_control, token):
+        if tracer.enabled:
+            tracer.record(tracing.TOKEN_RECEIVED, token)
+        self.token = token
+        if self.state == RegistrationState.PENDING:
+            self.state = RegistrationState.TOKEN_RECEIVED
+        elif self.state == RegistrationState.TRIGGER_OWNED:
+            self.request_action()
+
+    def on_action_unavailable(self, action):
+        logger.error(f"[Wayland] Action for '{self.trigger_str}' is unavailable")
+        if self.state != RegistrationState.BOUND:
+            self.fail()
+
+    def request_action(self):
+        self.action = self.app.action_manager.get_input_trigger_action(self.token)
+        self.action.dispatcher['unavailable'] = self.on_action_unavailable
+        self.action.dispatcher['begin'] = self.app.dispatch_begin
+        self.action.dispatcher['end'] = self.app.dispatch_end
+        self.action.user_data = self
+        self.state = RegistrationState.ACTION_REQUESTED
+        self.notify_settled()
+
+    def confirm(self):
+        if self.state == RegistrationState.ACTION_REQUESTED:
+            self.state = RegistrationState.BOUND
+
+    def fail(self):
+        if self.state == RegistrationState.FAILED:
+            return
+        settled = self.state == RegistrationState.ACTION_REQUESTED
+        self.state = RegistrationState.FAILED
+        self.pool.forget(self)
+        self.destroy()
+        if not settled:
+            self.notify_settled()
+
+    def disconnect(self):
+        # The connection is gone and its objects with it; nothing is sent.
+        # Returns whether the registration was still waiting to settle.
+        settled = self.settled()
+        self.state = RegistrationState.FAILED
+        if self.action is not None:
+            self.action.user_data = None
+        self.trigger = self.action_control = self.action = None
+        return not settled
+
+    def notify_settled(self):
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            waiter(self)
+
+    def destroy(self):
+        if self.action is not None:
+            self.action.user_data = None
+        self.app.destroy_wayland_objects(self.wayland_objects())
+        self.trigger = self.action_control = self.action = None
+
+    def wayland_objects(self):
+        return {
+            'trigger': self.trigger,
+            'action_control': self.action_control,
+            'action': self.action
+        }
+
+class TriggerPool:
+    # Registers each (modifiers, keysym) with the compositor once, by keysym
+    # or by keycode, and counts its users; the Wayland objects are destroyed
+    # when the last one releases.
+    def __init__(self, app):
+        self.app = app
+        self.triggers = {} # ((modifiers, keysym), by_code) -> TriggerRegistration
+
+    def acquire(self, description, trigger_str):
+        key = parse_accelerator(trigger_str)
+        by_code = split_trigger(trigger_str)[1]
+        registration = self.triggers.get((key, by_code))
+        if registration is None:
+            registration = TriggerRegistration(self, key, by_code, description, trigger_str)
+            self.triggers[(key, by_code)] = registration
+            registration.refs += 1
+            registration.start()
+        else:
+            registration.refs += 1
+        return registration
+
+    def release(self, registration):
+        registration.refs -= 1
+        if registration.refs > 0:
+            return
+        self.forget(registration)
+        registration.destroy()
+
+    def disconnect(self):
+        # Fails every registration of a lost compositor connection. Every
+        # state changes before any batch hears of it, so no batch asks the
+        # dead display for a sync; batches already waiting for one complete
+        # right away.
+        registrations = list(self.triggers.values())
+        self.triggers = {}
+        unsettled = [registration for registration in registrations if registration.disconnect()]
+        for registration in unsettled:
+            registration.notify_settled()
+        for batch in list(self.app.pending_batches):
+            if batch.sync_callback is not None:
+                batch.sync_callback = None
+                batch.complete()
+
+    def forget(self, registration):
+        if self.triggers.get(registration.pool_key()) is registration:
+            del self.triggers[registration.pool_key()]
+
+class RegistrationBatch:
+    # Registers a set of shortcuts with the compositor without blocking on any
+    # reply: every request is queued up front and goes out with the next flush
+    # of the Wayland source, each TriggerRegistration advances as its events
+    # are dispatched, and on_complete is called once, after a single final
+    # sync, with {key: registration or None}. Each registration returned
+    # holds one pool reference for the caller to keep or release. The keys
+    # the compositor itself refused are in self.refused by then.
+    def __init__(self, app, requests, on_complete):
+        self.app = app
+        self.requests = requests # [(key, description, trigger_str)]
+        self.on_complete = on_complete
+        self.registrations = {}
+        self.refused = set()
+        self.unsettled = 0
+        self.started = False
+        self.cancelled = False
+        self.started_at = 0
+        self.sync_callback = None
+
+    def start(self):
+        if tracer.enabled:
+            self.started_at = GLib.get_monotonic_time()
+        # Nothing else refers to the batch once its registrations have
+        # settled; without this the batch and its sync callback are collected
+        # before the callback is answered
+        self.app.pending_batches.add(self)
+        pool = self.app.trigger_pool
+        for key, description, trigger_str in self.requests:
+            registration = pool.acquire(description, trigger_str)
+            self.registrations[key] = registration
+            if not registration.settled():
+                self.unsettled += 1
+                registration.waiters.append(self.on_settled)
+        self.started = True
+        self.check_settled()
+
+    def on_settled(self, registration):
+        self.unsettled -= 1
+        if self.started:
+            self.check_settled()
+
+    def cancel(self):
+        # Nobody wants the result any more. Every registration is released
+        # now, so the ones no other batch or shortcut uses are destroyed
+        # half-finished; on_complete is never called.
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.sync_callback = None
+        self.app.pending_batches.discard(self)
+        for registration in self.registrations.values():
+            if self.on_settled in registration.waiters:
+                registration.waiters.remove(self.on_settled)
+            self.app.trigger_pool.release(registration)
+
+    def check_settled(self):
+        if self.unsettled > 0:
+            return
+        if any(r.state == RegistrationState.ACTION_REQUESTED for r in self.registrations.values()):
+            # A single sync makes sure any 'unavailable' event for the new
+            # actions has been seen before the result is reported.
+            self.sync_callback = self.app.display.sync()
+            self.sync_callback.dispatcher['done'] = self.on_sync_done
+        else:
+            self.complete()
+
+    def on_sync_done(self, callback, data):
+        if self.cancelled:
+            return
+        self.sync_callback = None
+        for registration in self.registrations.values():
+            registration.confirm()
+        self.complete()
+
+    def complete(self):
+        registered = {}
+        for key, registration in self.registrations.items():
+            if registration.state == RegistrationState.BOUND:
+                registered[key] = registration
+            else:
+                if registration.refused:
+                    self.refused.add(key)
+                self.app.trigger_pool.release(registration)
+                registered[key] = None
+        if tracer.enabled and self.started_at:
+            now = GLib.get_monotonic_time()
+            tracer.record(tracing.REGISTERED, len(registered), now)
+            tracer.latency(tracing.REGISTRATION, self.started_at, now)
+        self.app.pending_batches.discard(self)
+        self.on_complete(registered)
+
+class GatekeeperApp(Gio.Application):
     def __init__(self):
         super().__init__(application_id="org.freedesktop.impl.portal.desktop.mir.Gatekeeper",
                          flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE)
@@ -230,22 +519,82 @@ class GatekeeperApp(Gtk.Application):
         self.registry = None
         self.trigger_manager: ExtInputTriggerRegistrationManagerV1 = None
         self.action_manager: ExtInputTriggerActionManagerV1 = None
+        # The capability bits of the registration manager; None until the
+        # compositor has sent them
+        self.capabilities = None
+        # The seat's keyboard sends the keymap for keycode triggers
+        self.seat = None
+        self.keyboard = None
+        self.keycodes = KeycodeMap()
         self.portal = None
         self.dbus_con = None
         self.dbus_id = None
+        self.delivery = None
+        self.changes = None
+        self.ui = None
         self.win = None
-        self.action: ExtInputTriggerActionV1 = None
+        self.wayland_source = None
+        self.registry_callback = None
+        self.wayland_ready = False
+        self.wayland_waiters = []
+        # Reconnecting after the compositor went away: the pending timeout,
+        # the attempts so far, when the connection was lost, and for the
+        # statistics how often and how fast it came back
+        self.reconnect_source = None
+        self.reconnect_attempts = 0
+        self.disconnected_at = 0
+        self.reconnects = 0
+        self.last_recovery_us = 0
+        # Every action shares the same two bound dispatchers and finds its
+        # routes through action.user_data. The begin/end events carry an
+        # xdg_activation token, not the action token, so there is no lookup
+        # by token.
+        self.dispatch_begin = self.on_action_begin
+        self.dispatch_end = self.on_action_end
+        self.trigger_pool = TriggerPool(self)
+        self.pending_batches = set()
+        self.store = ShortcutStore()
+        self.policy = ApprovalPolicy()
+        # Owners of every bound trigger and the triggers the compositor refused
+        self.conflicts = ConflictIndex()
+        # (app_id, s_id) -> TriggerRegistration re-registered from the store
+        # at startup; the pool reference is held until the app binds again
+        self.restored = {}
+        self.session_interface = None
+        self.request_interface = None
+        self.stats = None
+        # BindShortcuts invocations that have not been answered yet
+        self.pending_binds = {} # invocation -> PendingBind
+        # Requests waiting for the user, reviewed one dialog at a time
+        self.scheduler = BindScheduler(self, self.show_bind_dialog)
+        # Called instead of showing ShortcutDialog when set; returns the
+        # approved {s_id: trigger} or None. GATEKEEPER_AUTO_ACCEPT=1 accepts
+        # the preferred triggers, for tests and benchmarks.
+        self.dialog_hook = None
+        if os.environ.get('GATEKEEPER_AUTO_ACCEPT', '') not in ('', '0'):
+            self.dialog_hook = accept_preferred_triggers
+        # sender -> NameOwnerChanged subscription id; the sessions of each
+        # sender are in GlobalShortcutsPortal.by_sender
+        self.watched_senders = {}
 
     def do_startup(self):
-        Gtk.Application.do_startup(self)
+        Gio.Application.do_startup(self)
+        self.policy.start()
         self.setup_wayland()
         self.setup_dbus()
         self.hold()
         print("Gatekeeper running in background. Use --show-shortcuts to view UI.")
 
+    def load_ui(self):
+        if self.ui is None:
+            logger.info("Loading GTK user interface")
+            import ui
+            self.ui = ui
+        return self.ui
+
     def do_activate(self):
         if not self.win:
-            self.win = GatekeeperWindow(self)
+            self.win = self.load_ui().GatekeeperWindow(self)
             self.win.connect("destroy", self.on_window_destroy)
         self.win.present()
         print("Gatekeeper UI shown.")
@@ -264,6 +613,12 @@ class GatekeeperApp(Gtk.Application):
         return 0
 
     def setup_wayland(self):
+        if not self.connect_wayland():
+            # Handled like a lost connection: keep trying, while BindShortcuts
+            # calls wait for it up to the bind timeout
+            self.schedule_reconnect()
+
+    def connect_wayland(self):
         try:
             logger.info("Connecting to Wayland display...")
             self.display = Display()
@@ -271,29 +626,302 @@ class GatekeeperApp(Gtk.Application):
             logger.info("Wayland display connected. Fetching registry...")
             self.registry = self.display.get_registry()
             self.registry.dispatcher['global'] = self.registry_global
-            self.display.dispatch(block=True)
-            self.display.roundtrip()
-            fd = self.display.get_fd()
-            GLib.io_add_watch(fd, GLib.IO_IN, self.on_wayland_readable)
+            # The globals have all been announced once this sync is answered
+            self.registry_callback = self.display.sync()
+            self.registry_callback.dispatcher['done'] = self.on_registry_done
+            self.wayland_source = WaylandSource(self.display, self.on_wayland_disconnected)
+            self.wayland_source.attach(None)
         except Exception as e:
             logger.error(f"Failed to setup Wayland: {e}")
+            return False
+        return True
 
     def registry_global(self, registry, id, interface, version):
         if interface == "ext_input_trigger_registration_manager_v1":
             logger.info(f"[Wayland] Binding {interface}")
             self.trigger_manager = registry.bind(id, ExtInputTriggerRegistrationManagerV1, version)
+            self.trigger_manager.dispatcher['capabilities'] = self.on_trigger_capabilities
         elif interface == "ext_input_trigger_action_manager_v1":
             logger.info(f"[Wayland] Binding {interface}")
             self.action_manager = registry.bind(id, ExtInputTriggerActionManagerV1, version)
+        elif interface == "wl_seat" and self.seat is None:
+            self.seat = registry.bind(id, WlSeat, min(version, 7))
+            self.seat.dispatcher['capabilities'] = self.on_seat_capabilities
+            self.keycodes.expect()
 
-    def on_wayland_readable(self, source, condition):
-        self.display.read()
-        self.display.dispatch()
-        return True
+    def on_seat_capabilities(self, seat, capabilities):
+        if capabilities & WlSeat.capability.keyboard:
+            if self.keyboard is None:
+                self.keyboard = seat.get_keyboard()
+                self.keyboard.dispatcher['keymap'] = self.on_keymap
+        elif self.keyboard is None:
+            self.keycodes.unavailable()
+
+    def on_keymap(self, keyboard, keymap_format, fd, size):
+        if keymap_format != XKB_KEYMAP_FORMAT_TEXT_V1:
+            os.close(fd)
+            logger.warning("The compositor sent no XKB keymap; keycode triggers are not available")
+            self.keycodes.unavailable()
+            return
+        try:
+            keymap_text = read_keymap(fd, size)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read the keymap: {e}")
+            self.keycodes.unavailable()
+            return
+        logger.debug("Received a keymap of %d bytes", size)
+        self.keycodes.load(keymap_text)
+
+    def on_trigger_capabilities(self, manager, capabilities):
+        if capabilities != self.capabilities:
+            logger.info(f"[Wayland] Trigger capabilities: {capabilities:#x}")
+        gained_keyboard = not self.keyboard_supported() and capabilities & CAPABILITY_KEYBOARD
+        self.capabilities = capabilities
+        if gained_keyboard and self.wayland_ready:
+            # What could not be registered without a keyboard can be now
+            self.restore_shortcuts()
+
+    def on_registry_done(self, callback, data):
+        self.registry_callback = None
+        if self.trigger_manager and self.action_manager:
+            if self.capabilities is None:
+                # The managers were bound after the registry sync was sent;
+                # one more sync has their capabilities in before anything is
+                # registered
+                self.registry_callback = self.display.sync()
+                self.registry_callback.dispatcher['done'] = self.on_managers_ready
+                return
+            self.on_managers_ready(None, 0)
+        else:
+            self.set_wayland_ready()
+
+    def on_managers_ready(self, callback, data):
+        self.registry_callback = None
+        if self.capabilities is None:
+            logger.warning("[Wayland] The compositor sent no trigger capabilities")
+        self.reconnect_attempts = 0
+        self.restore_shortcuts()
+
+    def keyboard_supported(self):
+        # Unknown capabilities are not held against a trigger
+        return self.capabilities is None or bool(self.capabilities & CAPABILITY_KEYBOARD)
+
+    def unsupported_reason(self, key):
+        # Why the compositor would refuse to register key, or None. Checked
+        # here so such triggers never cost a round trip.
+        if not self.keyboard_supported():
+            return "Keyboard shortcuts are not supported by the compositor"
+        return None
+
+    def restore_shortcuts(self):
+        # Stored triggers are claimed again before any BindShortcuts is
+        # handled, so a returning app gets its bindings back without a
+        # dialog. After a reconnect the shortcuts of the live sessions are
+        # registered again in the same batch. Run again when the compositor
+        # gains the keyboard capability, it only tries what is not bound.
+        requests = []
+        bound = set(self.restored)
+        sessions = self.portal.sessions if self.portal else {}
+        for session_handle, session in sessions.items():
+            for s_id, shortcut in session.shortcuts.items():
+                bound.add((session.app_id, s_id))
+                if shortcut.trigger_desc and shortcut.registration is None:
+                    requests.append((('session', session_handle, s_id), shortcut.description, shortcut.trigger_desc))
+        try:
+            stored = list(self.store.all_records())
+        except Exception:
+            # BindShortcuts waits for this restore; it has to finish
+            logger.exception("Could not load the shortcut store; restoring none of it")
+            stored = []
+        for app_id, s_id, trigger, description in stored:
+            if (app_id, s_id) not in bound:
+                requests.append((('store', app_id, s_id), description, trigger))
+        if not requests:
+            self.finish_restore()
+            return
+        logger.info(f"Restoring {len(requests)} shortcuts")
+
+        def on_restored(registered):
+            for key, registration in registered.items():
+                kind, owner, s_id = key
+                if kind == 'session':
+                    self.rebind_session_shortcut(owner, s_id, registration)
+                elif registration:
+                    if self.is_bound(owner, s_id):
+                        # A BindShortcuts of the app got there first
+                        self.trigger_pool.release(registration)
+                        continue
+                    self.restored[(owner, s_id)] = registration
+                    self.conflicts.add(registration.key, owner, s_id)
+                elif key in batch.refused:
+                    # The compositor refused it, so the app asks again instead
+                    # of the trigger being retried and counted as taken on
+                    # every start. Failures here (no keyboard capability or
+                    # keymap, a recently refused trigger) keep the record.
+                    logger.warning(f"The compositor refused stored shortcut {s_id} of {owner}; forgetting it")
+                    self.store.remove(owner, s_id)
+                else:
+                    logger.warning(f"Failed to restore stored shortcut {s_id} of {owner}")
+            self.finish_restore()
+
+        batch = RegistrationBatch(self, requests, on_restored)
+        batch.start()
+
+    def is_bound(self, app_id, s_id):
+        for session in (self.portal.sessions.values() if self.portal else ()):
+            shortcut = session.shortcuts.get(s_id) if session.app_id == app_id else None
+            if shortcut is not None and shortcut.registration is not None:
+                return True
+        return False
+
+    def rebind_session_shortcut(self, session_handle, s_id, registration):
+        session = self.portal.sessions.get(session_handle)
+        shortcut = session.shortcuts.get(s_id) if session else None
+        if shortcut is None:
+            if registration:
+                self.trigger_pool.release(registration)
+            return
+        if not registration:
+            logger.warning(f"Failed to register shortcut {s_id} of {session_handle} again")
+            return
+        route = self.add_route(registration, session_handle, s_id, session.sender, session.app_id)
+        shortcut.bind(shortcut.trigger_desc, registration, route)
+        self.portal.invalidate(session_handle)
+        # The tokens are new; the clients learn them from ShortcutsChanged
+        self.changes.add(session_handle, s_id, dict(
+            trigger_entries(shortcut.trigger_desc),
+            trigger_action_token=GLib.Variant('s', registration.token)))
+
+    def finish_restore(self):
+        if self.trigger_manager is None:
+            # Lost again while restoring; the next connection restores
+            return
+        if self.disconnected_at:
+            now = GLib.get_monotonic_time()
+            if tracer.enabled:
+                tracer.latency(tracing.RECOVERY, self.disconnected_at, now)
+            self.last_recovery_us = now - self.disconnected_at
+            self.disconnected_at = 0
+            self.reconnects += 1
+            logger.info(f"[Wayland] Compositor connection restored in {self.last_recovery_us // 1000} ms")
+        self.set_wayland_ready()
+
+    def release_restored(self, app_id, s_id):
+        registration = self.restored.pop((app_id, s_id), None)
+        if registration is not None:
+            self.conflicts.remove(registration.key, app_id, s_id)
+            self.trigger_pool.release(registration)
+
+    def forget_shortcut(self, session_path, s_id):
+        # Revokes an approval from the shortcuts window. The trigger stops
+        # working in every session of the app and is not restored again; the
+        # app has to ask with BindShortcuts to get it back.
+        session = self.portal.sessions.get(session_path)
+        if session is None:
+            return
+        app_id = session.app_id
+        logger.info(f"Forgetting shortcut {s_id} of {app_id}")
+        self.store.remove(app_id, s_id)
+        self.release_restored(app_id, s_id)
+        for session_handle, other in self.portal.sessions.items():
+            shortcut = other.shortcuts.get(s_id) if other.app_id == app_id else None
+            if shortcut is None or not shortcut.trigger_desc:
+                continue
+            self.unbind_shortcut(shortcut)
+            shortcut.bind('', None, None)
+            self.portal.invalidate(session_handle)
+            self.changes.add(session_handle, s_id, {'trigger_description': GLib.Variant('s', '')})
+            if self.win:
+                self.win.sync_shortcuts(session_handle, [s_id])
+        if self.wayland_source:
+            self.wayland_source.flush()
+
+    def set_wayland_ready(self):
+        self.wayland_ready = True
+        waiters, self.wayland_waiters = self.wayland_waiters, []
+        for waiter in waiters:
+            waiter()
+
+    def when_wayland_ready(self, func, timeout_ms=0, on_timeout=None):
+        # With a timeout, on_timeout runs instead of func if the compositor
+        # is not there within timeout_ms
+        if self.wayland_ready:
+            func()
+            return
+        if not timeout_ms:
+            self.wayland_waiters.append(func)
+            return
+
+        def on_ready():
+            GLib.source_remove(source)
+            func()
+
+        def on_expired():
+            self.wayland_waiters.remove(on_ready)
+            on_timeout()
+            return GLib.SOURCE_REMOVE
+
+        source = GLib.timeout_add(timeout_ms, on_expired)
+        self.wayland_waiters.append(on_ready)
+
+    def on_wayland_disconnected(self):
+        logger.error("[Wayland] Compositor connection lost; reconnecting")
+        # self.wayland_source is kept: it is still being dispatched, and
+        # dropping the last reference from here crashes the main loop
+        self.trigger_manager = None
+        self.action_manager = None
+        self.seat = self.keyboard = None
+        self.capabilities = None
+        self.registry_callback = None
+        if not self.disconnected_at:
+            self.disconnected_at = GLib.get_monotonic_time()
+        # Batches in flight complete with failures; this may run waiters
+        self.trigger_pool.disconnect()
+        # Nothing waits for the old seat's keymap any more; the new seat is
+        # expected once the registry announces it
+        self.keycodes.unavailable()
+        self.wayland_ready = False
+        # Keep every shortcut but drop what referred to the old connection
+        for (app_id, s_id), registration in self.restored.items():
+            self.conflicts.remove(registration.key, app_id, s_id)
+        self.restored = {}
+        # What the old compositor refused may well be free in the new one
+        self.conflicts.refused.clear()
+        if self.portal:
+            for session in self.portal.sessions.values():
+                for shortcut in session.shortcuts.values():
+                    if shortcut.registration is not None:
+                        self.remove_route(shortcut.registration, shortcut.route)
+                        shortcut.registration = shortcut.route = None
+            self.portal.listings.clear()
+        self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        delay = min(RECONNECT_MIN_DELAY_MS << min(self.reconnect_attempts, 16), RECONNECT_MAX_DELAY_MS)
+        self.reconnect_attempts += 1
+        logger.info(f"[Wayland] Reconnecting in {delay} ms")
+        self.reconnect_source = GLib.timeout_add(delay, self.on_reconnect_timeout)
+
+    def on_reconnect_timeout(self):
+        self.reconnect_source = None
+        # The old source has removed itself by now and can be let go
+        if self.display is not None:
+            try:
+                self.display.disconnect()
+            except Exception as e:
+                logger.debug("Closing the old display failed: %s", e)
+        self.display = self.registry = self.wayland_source = None
+        if not self.connect_wayland():
+            self.schedule_reconnect()
+        return GLib.SOURCE_REMOVE
 
     def setup_dbus(self):
         self.portal = GlobalShortcutsPortal(self)
         self.dbus_con = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        self.delivery = ActivationDelivery(self.dbus_con)
+        self.changes = ChangeBatcher(self.dbus_con, "/org/freedesktop/portal/desktop")
+        self.session_interface = Gio.DBusNodeInfo.new_for_xml(SESSION_XML).interfaces[0]
+        self.request_interface = Gio.DBusNodeInfo.new_for_xml(REQUEST_XML).interfaces[0]
         node_info = Gio.DBusNodeInfo.new_for_xml(GLOBAL_SHORTCUTS_XML)
         interface_info = node_info.interfaces[0]
         self.dbus_id = self.dbus_con.register_object(
@@ -302,208 +930,430 @@ class GatekeeperApp(Gtk.Application):
             self.on_method_call,
             None, None
         )
+        self.stats = GatekeeperStats(self)
+        self.stats.register(self.dbus_con, "/org/freedesktop/portal/desktop")
         Gio.bus_own_name_on_connection(self.dbus_con, "org.freedesktop.impl.portal.desktop.mir", Gio.BusNameOwnerFlags.NONE, None, None)
 
     def on_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        if tracer.enabled:
+            tracer.record(tracing.DBUS_RECEIVED, method_name)
         args = parameters.unpack()
         if method_name == "CreateSession":
             request_handle, session_handle, app_id, options = args
+            if session_handle in self.portal.sessions:
+                self.close_sessions([session_handle])
             # [CHANGE] Pass invocation.get_sender() to track who created the session
             res = self.portal.CreateSession(request_handle, session_handle, app_id, options, invocation.get_sender())
+            self.track_session(session_handle)
             invocation.return_value(GLib.Variant("(ua{sv})", res))
         elif method_name == "BindShortcuts":
             request_handle, session_handle, shortcuts, parent_window, options = args
-            if not self.trigger_manager or not self.action_manager:
-                logger.error("Input trigger protocols not available")
-                invocation.return_value(GLib.Variant("(ua{sv})", (2, {})))
-                return
-            self.prompt_for_shortcuts(session_handle, shortcuts, invocation)
+            self.track_bind(request_handle, session_handle, invocation)
+            self.when_wayland_ready(lambda: self.start_bind_shortcuts(session_handle, shortcuts, invocation),
+                                    self.scheduler.timeout_ms, lambda: self.on_wayland_wait_expired(invocation))
         elif method_name == "ListShortcuts":
             request_handle, session_handle = args
             res = self.portal.ListShortcuts(request_handle, session_handle)
             invocation.return_value(GLib.Variant("(ua{sv})", res))
 
+    def track_session(self, session_handle):
+        # Sessions end when the client calls Close on the session object or
+        # when its bus name goes away, whichever happens first
+        session = self.portal.sessions[session_handle]
+        try:
+            session.object_id = self.dbus_con.register_object(
+                session_handle, self.session_interface, self.on_session_method_call, None, None)
+        except GLib.Error as e:
+            logger.warning(f"Could not export session {session_handle}: {e.message}")
+        sender = session.sender
+        if sender not in self.watched_senders:
+            self.watched_senders[sender] = self.dbus_con.signal_subscribe(
+                "org.freedesktop.DBus", "org.freedesktop.DBus", "NameOwnerChanged",
+                "/org/freedesktop/DBus", sender, Gio.DBusSignalFlags.NONE,
+                self.on_name_owner_changed, None)
+
+    def track_bind(self, request_handle, session_handle, invocation):
+        pending = self.pending_binds[invocation] = PendingBind(request_handle, session_handle, invocation.get_sender())
+        try:
+            pending.object_id = self.dbus_con.register_object(
+                request_handle, self.request_interface, self.on_request_method_call, None, None)
+        except GLib.Error as e:
+            logger.warning(f"Could not export request {request_handle}: {e.message}")
+
+    def on_request_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        if method_name == "Close":
+            closing = [(bind_invocation, pending) for bind_invocation, pending in self.pending_binds.items()
+                       if pending.request_handle == object_path]
+            if any(pending.sender and sender != pending.sender for _, pending in closing):
+                logger.warning(f"{sender} may not close request {object_path}")
+                invocation.return_dbus_error(ERROR_ACCESS_DENIED, "The request belongs to another client")
+                return
+            for bind_invocation, pending in closing:
+                logger.info(f"Request {object_path} closed by {sender}")
+                self.cancel_bind(bind_invocation)
+            invocation.return_value(None)
+
+    def cancel_bind(self, invocation):
+        # Drops whatever the request is waiting for: its place in the review
+        # queue or dialog, or its registrations in the compositor
+        pending = self.pending_binds.get(invocation)
+        if pending is None:
+            return
+        if pending.batch is not None:
+            pending.batch.cancel()
+            # The destroy requests of the partial registrations go out now
+            if self.wayland_source:
+                self.wayland_source.flush()
+        if not self.scheduler.cancel(invocation):
+            self.finish_bind(invocation, 2, {})
+
+    def on_session_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        if method_name == "Close":
+            session = self.portal.sessions.get(object_path)
+            if session is not None and session.sender and sender != session.sender:
+                logger.warning(f"{sender} may not close session {object_path} of {session.sender}")
+                invocation.return_dbus_error(ERROR_ACCESS_DENIED, "The session belongs to another client")
+                return
+            logger.info(f"Session {object_path} closed by {sender}")
+            # The client asked for it; no Closed signal
+            self.close_sessions([object_path], notify=False)
+            invocation.return_value(None)
+
+    def on_name_owner_changed(self, connection, sender_name, object_path, interface_name, signal_name, parameters, user_data):
+        name, old_owner, new_owner = parameters.unpack()
+        handles = self.portal.by_sender.get(name)
+        if new_owner or not handles:
+            return
+        logger.info(f"{name} left the bus; closing {len(handles)} sessions")
+        self.close_sessions(list(handles))
+
+    def close_sessions(self, session_handles, notify=True):
+        # notify: tell the owner with the session's Closed signal, for
+        # sessions gatekeeper ends on its own
+        closed = 0
+        for session_handle in session_handles:
+            session = self.portal.remove_session(session_handle)
+            if session is None:
+                continue
+            closed += 1
+            self.changes.forget(session_handle)
+            for invocation, pending in list(self.pending_binds.items()):
+                if pending.session_handle == session_handle:
+                    self.cancel_bind(invocation)
+            for shortcut in session.shortcuts.values():
+                self.unbind_shortcut(shortcut)
+            if session.object_id:
+                if notify:
+                    self.dbus_con.emit_signal(session.sender, session_handle, SESSION_INTERFACE, "Closed", None)
+                self.dbus_con.unregister_object(session.object_id)
+            self.unwatch_sender(session.sender)
+            if self.win:
+                self.win.remove_session(session_handle)
+        if not closed:
+            return
+        # The destroy requests of every released trigger go out together
+        if self.wayland_source:
+            self.wayland_source.flush()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Closed %d sessions; live objects: %s", closed, self.live_objects())
+
+    def unwatch_sender(self, sender):
+        # Once the last session of a client is gone
+        if sender in self.portal.by_sender or sender not in self.watched_senders:
+            return
+        self.dbus_con.signal_unsubscribe(self.watched_senders.pop(sender))
+        self.delivery.forget(sender)
+
+    def live_objects(self):
+        triggers = self.trigger_pool.triggers.values()
+        return {
+            'sessions': len(self.portal.sessions) if self.portal else 0,
+            'shortcuts': sum(len(session.shortcuts) for session in self.portal.sessions.values()) if self.portal else 0,
+            'triggers': len(triggers),
+            'routes': sum(len(registration.routes) for registration in triggers),
+            'wayland_objects': sum(1 for registration in triggers
+                                   for obj in registration.wayland_objects().values()
+                                   if obj is not None and not obj.destroyed),
+            'restored': len(self.restored),
+            'cached_listings': len(self.portal.listings) if self.portal else 0,
+            'owned_triggers': len(self.conflicts.owners),
+            'refused_triggers': len(self.conflicts.refused),
+            'watched_senders': len(self.watched_senders),
+            'delivery_channels': len(self.delivery.channels) if self.delivery else 0
+        }
+
+    def on_wayland_wait_expired(self, invocation):
+        if invocation not in self.pending_binds:
+            return
+        logger.warning(f"No compositor within {self.scheduler.timeout_ms} ms; answering BindShortcuts with 2")
+        self.finish_bind(invocation, 2, {})
+
+    def start_bind_shortcuts(self, session_handle, shortcuts, invocation):
+        if invocation not in self.pending_binds:
+            # Closed while waiting for the compositor
+            return
+        if not self.trigger_manager or not self.action_manager:
+            logger.error("Input trigger protocols not available")
+            self.finish_bind(invocation, 2, {})
+            return
+        if not self.keyboard_supported():
+            # Nothing could be bound; no point in asking the user
+            logger.error("The compositor does not support keyboard triggers")
+            self.finish_bind(invocation, 2, {})
+            return
+
+        session = self.portal.sessions.get(session_handle)
+        if session is None:
+            self.finish_bind(invocation, 2, {})
+            return
+        # Shortcuts the user already approved for this app are bound again
+        # from the store without asking
+        stored = self.store.lookup(session.app_id)
+        if shortcuts and all(s_id in stored for s_id, options in shortcuts):
+            triggers = {s_id: stored[s_id][0] for s_id, options in shortcuts}
+            self.register_shortcuts_sequence(session_handle, shortcuts, triggers, invocation)
+            return
+        # So are requests a policy rule approves in full, unless a trigger
+        # is already bound elsewhere; the user gets to see that first
+        triggers = self.policy.approve(session.app_id, shortcuts)
+        if triggers is not None and not self.has_conflicts(session.app_id, triggers):
+            self.register_shortcuts_sequence(session_handle, shortcuts, triggers, invocation)
+            return
+        self.prompt_for_shortcuts(session_handle, shortcuts, invocation)
+
+    def has_conflicts(self, app_id, triggers):
+        parsed = parse_accelerators(triggers)
+        for s_id, key in parsed.items():
+            if self.conflicts.is_refused(key) or self.conflicts.conflicts(key, app_id, s_id):
+                logger.info(f"Trigger {triggers[s_id]} of {app_id} conflicts with a bound shortcut")
+                return True
+        return False
+
+    def describe_conflict(self, app_id, s_id, trigger_str):
+        # Shown next to a trigger in the dialogs: None if it can be bound
+        if not trigger_str:
+            return None
+        key = parse_accelerator(trigger_str)
+        if not key[1]:
+            return "Not a valid shortcut"
+        return self.unsupported_reason(key) or self.conflicts.describe(key, app_id, s_id)
+
     def prompt_for_shortcuts(self, session_handle, shortcuts, invocation):
+        if self.dialog_hook:
+            # Answered without a dialog: None stands for a cancelled dialog
+            triggers = self.dialog_hook(session_handle, shortcuts)
+            if triggers is None:
+                self.finish_bind(invocation, 1, {})
+            else:
+                self.register_shortcuts_sequence(session_handle, shortcuts, triggers, invocation)
+            return
+        app_id = self.portal.sessions[session_handle].app_id
+        self.scheduler.submit(session_handle, app_id, shortcuts, invocation)
+
+    def show_bind_dialog(self, requests, on_answer):
         parent = self.win if self.win else None
-        dialog = ShortcutDialog(parent, shortcuts)
-        dialog.connect("response", self.on_dialog_response, session_handle, shortcuts, invocation)
+        dialog = self.load_ui().ShortcutDialog(
+            parent, [(request.app_id, request.shortcuts) for request in requests], self.describe_conflict)
+        if tracer.enabled:
+            for request in requests:
+                tracer.record(tracing.DIALOG_SHOWN, request.session_handle)
+        dialog.connect("response", self.on_dialog_response, requests, on_answer)
         dialog.show()
+        return dialog
 
-    def on_dialog_response(self, dialog, response_id, session_handle, shortcuts, invocation):
+    def on_dialog_response(self, dialog, response_id, requests, on_answer):
+        if tracer.enabled:
+            for request in requests:
+                tracer.record(tracing.DIALOG_ANSWERED, request.session_handle)
         triggers = dialog.get_triggers()
+        accepted = dialog.accepted(response_id)
         dialog.destroy()
-        if response_id == Gtk.ResponseType.OK:
-            self.register_shortcuts_sequence(session_handle, shortcuts, triggers, invocation)
-        else:
-            invocation.return_value(GLib.Variant("(ua{sv})", (1, {})))
+        on_answer(triggers if accepted else [None] * len(requests))
 
     def register_shortcuts_sequence(self, session_handle, shortcuts, triggers, invocation):
         session = self.portal.sessions.get(session_handle)
         if not session:
-            invocation.return_value(GLib.Variant("(ua{sv})", (2, {})))
-            return
-
-        # [CHANGE] Retrieve the client sender ID from the session
-        client_sender_id = session.get('sender')
-
-        pending = len(shortcuts)
-        results = {}
-
-        if pending == 0:
-            invocation.return_value(GLib.Variant("(ua{sv})", (0, {'shortcuts': GLib.Variant('a(sa{sv})', [])})))
-            return
-
-        def on_one_done(s_id, success, token, trigger_desc, wayland_objects=None):
-            nonlocal pending
-            if success:
-                logger.info(f"Successfully registered shortcut {s_id} with token {token}")
-                results[s_id] = {'trigger_action_token': GLib.Variant('s', token)}
-
-                desc = ""
-                for sid, opts in shortcuts:
-                    if sid == s_id:
-                        desc = opts.get('description', '')
-                        break
-
-                action = self.action_manager.get_input_trigger_action(token)
-
-                # [CHANGE] Use client_sender_id to direct the call to the specific app
-                def on_action_begin(proxy, time, token):
-                    logger.debug(f"Triggering Activated for {s_id} on {client_sender_id}")
-                    if client_sender_id:
-                        self.dbus_con.call(
-                            client_sender_id,
-                            session_handle,
-                            "org.freedesktop.portal.GlobalShortcuts",
-                            "Activated",
-                            GLib.Variant("(sua{sv})", (s_id, time, {})),
-                            GLib.VariantType.new("()"),
-                            Gio.DBusCallFlags.NONE,
-                            -1, None, None
-                        )
-
-                def on_action_end(proxy, time, token):
-                    logger.debug(f"Triggering Deactivated for {s_id} on {client_sender_id}")
-                    if client_sender_id:
-                        self.dbus_con.call(
-                            client_sender_id,
-                            session_handle,
-                            "org.freedesktop.portal.GlobalShortcuts",
-                            "Deactivated",
-                            GLib.Variant("(sua{sv})", (s_id, time, {})),
-                            GLib.VariantType.new("()"),
-                            Gio.DBusCallFlags.NONE,
-                            -1, None, None
-                        )
-
-                action.dispatcher['begin'] = on_action_begin
-                action.dispatcher['end'] = on_action_end
-
-                self.display.roundtrip()
-                wayland_objects['action'] = action
-
-                session['shortcuts'][s_id] = {
-                    'description': desc,
-                    'trigger_desc': trigger_desc,
-                    'token': token,
-                    'wayland_objects': wayland_objects
-                }
-            else:
-                logger.warning(f"Failed to register shortcut {s_id}")
+            self.finish_bind(invocation, 2, {})
+            return
 
-            pending -= 1
-            if pending == 0:
-                shortcuts_list = []
-                for sid, data in results.items():
-                    shortcuts_list.append((sid, data))
-                final_results = {'shortcuts': GLib.Variant('a(sa{sv})', shortcuts_list)}
-                invocation.return_value(GLib.Variant("(ua{sv})", (0, final_results)))
-                if self.win:
-                    self.win.refresh_list()
+        if len(shortcuts) == 0:
+            self.finish_bind(invocation, 0, {'shortcuts': GLib.Variant('a(sa{sv})', [])})
+            return
 
+        app_id = session.app_id
+        parsed = parse_accelerators(triggers)
+        requests = []
         for s_id, options in shortcuts:
             trigger_str = triggers.get(s_id)
-            if trigger_str:
-                self.register_single_shortcut(s_id, options.get('description', ''), trigger_str, on_one_done)
-            else:
-                on_one_done(s_id, False, None, None)
-
-    def register_single_shortcut(self, s_id, description, trigger_str, callback):
-        mods, keyval = parse_accelerator(trigger_str)
-        if not self.trigger_manager:
-            logger.error("Trigger manager not available")
-            callback(s_id, False, None, trigger_str)
-            return
-
-        logger.debug(f"[Wayland] Registering trigger for '{s_id}'. Mods: {hex(mods)}, Key: {hex(keyval)}")
-        trigger = self.trigger_manager.register_keyboard_sym_trigger(mods, keyval)
-        context = {
-            's_id': s_id,
-            'description': description,
-            'trigger': trigger,
-            'trigger_str': trigger_str,
-            'callback': callback
-        }
-        trigger.dispatcher['done'] = self.on_trigger_done
-        trigger.dispatcher['failed'] = self.on_trigger_failed
-        trigger.user_data = context
-        self.display.roundtrip()
+            if not trigger_str or not parsed[s_id][1]:
+                logger.warning(f"Failed to register shortcut {s_id}")
+                continue
+            unsupported = self.unsupported_reason(parsed[s_id])
+            if unsupported:
+                logger.warning(f"Failed to register shortcut {s_id}: {unsupported}")
+                continue
+            requests.append((s_id, options.get('description', ''), trigger_str))
+        described = {s_id: (description, trigger_str) for s_id, description, trigger_str in requests}
 
-    def on_trigger_done(self, trigger):
-        context = trigger.user_data
-        action_control = self.trigger_manager.get_action_control(context['description'])
-        context['action_control'] = action_control
-        action_control.dispatcher['done'] = self.on_action_control_done
-        action_control.user_data = context
-        action_control.add_input_trigger_event(trigger)
-        self.display.roundtrip()
+        def on_batch_done(registered):
+            session = self.portal.sessions.get(session_handle)
+            shortcuts_list = []
+            for s_id, registration in registered.items():
+                # A trigger restored from the store was shared with this
+                # batch through the pool; the startup reservation can go now
+                self.release_restored(app_id, s_id)
+                if not registration:
+                    logger.warning(f"Failed to register shortcut {s_id}")
+                    continue
+                if not session:
+                    self.trigger_pool.release(registration)
+                    continue
+                logger.info("Successfully registered shortcut %s with token %s", s_id, registration.token)
+                description, trigger_str = described[s_id]
+                previous = session.shortcuts.get(s_id)
+                if previous:
+                    self.unbind_shortcut(previous)
+                route = self.add_route(registration, session_handle, s_id, session.sender, app_id)
+                session.shortcuts[s_id] = Shortcut(description, trigger_str, registration, route)
+                self.store.put(app_id, s_id, trigger_str, description)
+                shortcuts_list.append((s_id, {'trigger_action_token': GLib.Variant('s', registration.token)}))
 
-    def on_action_control_done(self, action_control, token):
-        context = action_control.user_data
-        wayland_objects = {
-            'trigger': context['trigger'],
-            'action_control': action_control
-        }
-        context['callback'](context['s_id'], True, token, context['trigger_str'], wayland_objects)
+            if shortcuts_list:
+                self.portal.invalidate(session_handle)
+            self.finish_bind(invocation, 0, {'shortcuts': GLib.Variant('a(sa{sv})', shortcuts_list)})
+            if self.win:
+                self.win.sync_shortcuts(session_handle, list(registered))
 
-    def on_trigger_failed(self, trigger):
-        context = trigger.user_data
-        logger.error(f"[Wayland] Trigger registration failed for {context['s_id']}")
-        context['callback'](context['s_id'], False, None, context['trigger_str'])
+        batch = RegistrationBatch(self, requests, on_batch_done)
+        pending = self.pending_binds.get(invocation)
+        if pending is not None:
+            pending.batch = batch
+        batch.start()
+
+    def finish_bind(self, invocation, response, results):
+        pending = self.pending_binds.pop(invocation, None)
+        if pending is not None and pending.object_id:
+            self.dbus_con.unregister_object(pending.object_id)
+        invocation.return_value(GLib.Variant("(ua{sv})", (response, results)))
+
+    def add_route(self, registration, session_handle, s_id, client_sender_id, app_id):
+        route = ActivationRoute(client_sender_id, app_id, session_handle, s_id)
+        registration.routes.append(route)
+        self.conflicts.add(registration.key, app_id, s_id)
+        return route
+
+    def remove_route(self, registration, route):
+        if route in registration.routes:
+            registration.routes.remove(route)
+            self.conflicts.remove(registration.key, route.app_id, route.shortcut_id)
+
+    def unbind_shortcut(self, shortcut):
+        # Drops one session's use of a trigger; the compositor registration
+        # itself goes away with the last user
+        registration = shortcut.registration
+        if registration is None:
+            return
+        self.remove_route(registration, shortcut.route)
+        self.trigger_pool.release(registration)
+        shortcut.registration = shortcut.route = None
+
+    def on_action_begin(self, action, time, activation_token):
+        if tracer.enabled:
+            tracer.record(tracing.ACTION_BEGIN, activation_token)
+        registration = action.user_data
+        if registration is None:
+            return
+        for route in registration.routes:
+            if route.sender:
+                logger.debug("Triggering Activated for %s on %s", route.shortcut_id, route.sender)
+                self.delivery.send(route, ACTIVATED, time)
+
+    def on_action_end(self, action, time, activation_token):
+        if tracer.enabled:
+            tracer.record(tracing.ACTION_END, activation_token)
+        registration = action.user_data
+        if registration is None:
+            return
+        for route in registration.routes:
+            if route.sender:
+                logger.debug("Triggering Deactivated for %s on %s", route.shortcut_id, route.sender)
+                self.delivery.send(route, DEACTIVATED, time)
+
+    def destroy_wayland_objects(self, wayland_objects):
+        for key in ('action', 'action_control', 'trigger'):
+            obj = wayland_objects.get(key)
+            if obj is not None and not obj.destroyed:
+                obj.destroy()
 
     def update_shortcut(self, session_path, s_id, new_trigger_str):
-        logger.info(f"Updating shortcut {s_id} for session {session_path} to {new_trigger_str}")
-        session = self.portal.sessions.get(session_path)
-        if session and s_id in session['shortcuts']:
-            old_objects = session['shortcuts'][s_id].get('wayland_objects')
-            if old_objects:
-                if 'action_control' in old_objects: old_objects['action_control'].destroy()
-                if 'trigger' in old_objects: old_objects['trigger'].destroy()
-
-        def on_done(sid, success, token, trigger_desc, wayland_objects=None):
-            if success:
-                session = self.portal.sessions.get(session_path)
-                if session:
-                    session['shortcuts'][s_id]['trigger_desc'] = trigger_desc
-                    session['shortcuts'][s_id]['token'] = token
-                    session['shortcuts'][s_id]['wayland_objects'] = wayland_objects
-
-                    changed = [(s_id, {'trigger_action_token': GLib.Variant('s', token)})]
-                    logger.debug(f"Emitting ShortcutsChanged signal for {s_id}")
-                    self.dbus_con.emit_signal(
-                        None,
-                        "/org/freedesktop/portal/desktop",
-                        "org.freedesktop.impl.portal.GlobalShortcuts",
-                        "ShortcutsChanged",
-                        GLib.Variant("(oa(sa{sv}))", (session_path, changed))
-                    )
-                    if self.win:
-                        self.win.refresh_list()
+        self.update_shortcuts(session_path, {s_id: new_trigger_str})
 
+    def update_shortcuts(self, session_path, triggers, on_done=None):
+        # Rebinds shortcuts make-before-break, as one transaction: the new
+        # triggers are registered in a single batch while the old ones keep
+        # working, then every route switches over at once and only after
+        # that are the old triggers released. If any new trigger fails, the
+        # ones that did register are released and all shortcuts keep their
+        # old triggers. on_done(bool) reports whether the rebind happened.
         session = self.portal.sessions.get(session_path)
-        if session and s_id in session['shortcuts']:
-            desc = session['shortcuts'][s_id]['description']
-            self.register_single_shortcut(s_id, desc, new_trigger_str, on_done)
+        requests = []
+        for s_id, trigger_str in triggers.items():
+            if not session or s_id not in session.shortcuts:
+                continue
+            logger.info(f"Updating shortcut {s_id} for session {session_path} to {trigger_str}")
+            conflict = self.describe_conflict(session.app_id, s_id, trigger_str)
+            if conflict:
+                logger.warning(f"{trigger_str} for {s_id}: {conflict}")
+            key = parse_accelerator(trigger_str)
+            if not key[1] or self.conflicts.is_refused(key):
+                # Would fail in the compositor; keep the current bindings
+                logger.warning(f"Not rebinding session {session_path}: '{trigger_str}' cannot be registered")
+                if on_done:
+                    on_done(False)
+                return
+            requests.append((s_id, session.shortcuts[s_id].description, trigger_str))
+        if not requests:
+            if on_done:
+                on_done(False)
+            return
+
+        def on_batch_done(registered):
+            session = self.portal.sessions.get(session_path)
+            failed = [s_id for s_id, registration in registered.items() if not registration]
+            if failed or not session:
+                if failed:
+                    logger.warning(f"Failed to rebind {', '.join(failed)}; keeping the current triggers")
+                for registration in registered.values():
+                    if registration:
+                        self.trigger_pool.release(registration)
+                if on_done:
+                    on_done(False)
+                return
+
+            replaced = []
+            for s_id, registration in registered.items():
+                shortcut = session.shortcuts.get(s_id)
+                if shortcut is None:
+                    self.trigger_pool.release(registration)
+                    continue
+                replaced.append(Shortcut(shortcut.description, shortcut.trigger_desc, shortcut.registration, shortcut.route))
+                trigger_str = triggers[s_id]
+                route = self.add_route(registration, session_path, s_id, session.sender, session.app_id)
+                shortcut.bind(trigger_str, registration, route)
+                self.store.put(session.app_id, s_id, trigger_str, shortcut.description)
+                self.changes.add(session_path, s_id, dict(
+                    trigger_entries(trigger_str),
+                    trigger_action_token=GLib.Variant('s', registration.token)))
+            # Break: the old triggers go only now that nothing routes to them
+            for old in replaced:
+                self.unbind_shortcut(old)
+            self.portal.invalidate(session_path)
+            if self.win:
+                self.win.sync_shortcuts(session_path, list(registered))
+            if on_done:
+                on_done(True)
+
+        RegistrationBatch(self, requests, on_batch_done).start()
 
 if __name__ == "__main__":
     app = GatekeeperApp()
@@ -0,0 +1,92 @@
+import logging
+import mmap
+import os
+
+logger = logging.getLogger("Gatekeeper")
+
+try:
+    from xkbcommon import xkb
+except ImportError:
+    xkb = None
+
+# Keycodes of keysyms in the compositor's keymap, for triggers bound to a
+# physical key with register_keyboard_code_trigger.
+#
+# The keymap arrives on the wl_keyboard of the seat. The keysym -> keycode
+# table is built from it with xkbcommon on the first lookup and kept until
+# the compositor sends another keymap. Only the first layout is used, and
+# the lowest keycode wins for a keysym on several keys. Without the
+# xkbcommon Python module no keysym has a keycode.
+
+XKB_KEYMAP_FORMAT_TEXT_V1 = 1
+# Protocol keycodes are evdev codes; xkb keycodes are offset by 8
+EVDEV_OFFSET = 8
+
+def read_keymap(fd, size):
+    try:
+        with mmap.mmap(fd, size, mmap.MAP_PRIVATE, mmap.PROT_READ) as data:
+            return data[:].rstrip(b'\0').decode('utf-8')
+    finally:
+        os.close(fd)
+
+class KeycodeMap:
+    def __init__(self):
+        self.keymap_text = None
+        self.table = None # keysym -> evdev keycode
+        # A keyboard was announced and its keymap has not been sent yet
+        self.expected = False
+        self.waiters = []
+
+    def expect(self):
+        self.expected = True
+
+    def unavailable(self):
+        # The seat has no keyboard; nothing is coming
+        self.expected = False
+        self.notify()
+
+    def load(self, keymap_text):
+        self.keymap_text = keymap_text
+        self.table = None
+        self.expected = False
+        self.notify()
+
+    def ready(self):
+        return not self.expected
+
+    def when_ready(self, func):
+        if self.ready():
+            func()
+        else:
+            self.waiters.append(func)
+
+    def notify(self):
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            waiter()
+
+    def lookup(self, keysym):
+        if self.table is None:
+            self.table = self.build()
+        return self.table.get(keysym)
+
+    def build(self):
+        if self.keymap_text is None:
+            return {}
+        if xkb is None:
+            logger.warning("xkbcommon is not installed; keycode triggers are not available")
+            return {}
+        try:
+            keymap = xkb.Context().keymap_new_from_string(self.keymap_text)
+        except Exception as e:
+            logger.error(f"Could not compile the keymap: {e}")
+            return {}
+        table = {}
+        for key in range(keymap.min_keycode(), keymap.max_keycode() + 1):
+            if not keymap.num_layouts_for_key(key):
+                continue
+            for level in range(keymap.num_levels_for_key(key, 0)):
+                for keysym in keymap.key_get_syms_by_level(key, 0, level):
+                    table.setdefault(keysym, key - EVDEV_OFFSET)
+        logger.debug("Built keycode table for %d keysyms", len(table))
+        return table
@@ -0,0 +1,236 @@
+import fnmatch
+import json
+import logging
+import os
+import re
+
+from gi.repository import GLib, Gio
+
+from accelerator import fold_modifiers, format_accelerator, keysym_to_name, parse_accelerator, parse_modifiers, preferred_trigger, split_accelerator
+
+logger = logging.getLogger("Gatekeeper")
+
+# Auto-approval policy. Requests that fully match a rule are registered with
+# their preferred triggers without showing ShortcutDialog; everything else
+# still goes to the dialog. The policy is a JSON file:
+#
+#   {"rules": [
+#     {"app_id": "org.example.*",
+#      "shortcuts": ["toggle-*", "mute"],
+#      "allow_triggers": ["<Control><Alt>*", "XF86AudioMute"],
+#      "deny_triggers": ["<Control><Alt>Delete"]}
+#   ]}
+#
+# app_id and shortcuts take globs and default to "*". Trigger lists take
+# accelerators, compared by their (modifiers, keysym), or globs. Modifiers
+# held on one side count as the modifier itself, so "<Control><Alt>Delete"
+# also catches "<Control_L><Alt>Delete" and "<Control><Alt_R>Delete". A glob
+# with modifiers, "<Super>*", matches every trigger holding at least those
+# modifiers whose key name matches the rest: "<Super_L>l", "Super+l",
+# "<Control><Super>l". Other globs are matched against the whole trigger as
+# format_accelerator writes it, so "XF86Audio*" only catches keys without
+# modifiers. Without allow_triggers any valid trigger is allowed.
+# A request matches a rule when the rule matches its app_id and every
+# shortcut in it: the id matches, it has a preferred trigger, the trigger
+# is allowed and not denied. The file is watched and reloaded on change.
+
+GLOB_CHARS = frozenset('*?[')
+# Changes to the file usually arrive as several events; reload once they stop
+RELOAD_DELAY_MS = 200
+
+def default_policy_path():
+    path = os.environ.get('GATEKEEPER_POLICY')
+    if path:
+        return path
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(config_home, 'gatekeeper', 'policy.json')
+
+def is_glob(pattern):
+    return not GLOB_CHARS.isdisjoint(pattern)
+
+def split_glob(pattern):
+    # "<Alt_L><Ctrl>*" and "Ctrl+Alt+*" -> (MOD_CTRL | MOD_ALT, "*"); None for
+    # patterns without a modifier prefix, or with globs in it
+    modifier_names, key = split_accelerator(pattern)
+    if not modifier_names or not key:
+        return None
+    mods = parse_modifiers(modifier_names)
+    if mods is None:
+        return None
+    return fold_modifiers(mods), key.strip()
+
+def compile_globs(patterns):
+    # One regex for a list of globs, or None when the list matches anything
+    if not patterns or '*' in patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+class TriggerSet:
+    # Accelerators by their parsed key with the modifiers folded, so
+    # "<Ctrl>q", "Control+q" and "<Control_L>q" are the same entry; globs
+    # with modifiers by those modifiers, over the key name; and the other
+    # globs over the formatted key
+    __slots__ = ('keys', 'mod_globs', 'globs')
+
+    def __init__(self, patterns):
+        self.keys = set()
+        mod_globs = {}
+        globs = []
+        for pattern in patterns:
+            if is_glob(pattern):
+                split = split_glob(pattern)
+                if split is None:
+                    globs.append(pattern)
+                else:
+                    mod_globs.setdefault(split[0], []).append(split[1])
+                continue
+            mods, keysym = parse_accelerator(pattern)
+            if not keysym:
+                raise ValueError(f"invalid trigger {pattern!r}")
+            self.keys.add((fold_modifiers(mods), keysym))
+        self.mod_globs = [(mods, compile_globs(key_globs)) for mods, key_globs in mod_globs.items()]
+        self.globs = re.compile('|'.join(fnmatch.translate(glob) for glob in globs)) if globs else None
+
+    def matches(self, key):
+        mods, keysym = key
+        mods = fold_modifiers(mods)
+        if (mods, keysym) in self.keys:
+            return True
+        for glob_mods, key_globs in self.mod_globs:
+            if mods & glob_mods == glob_mods and (key_globs is None or key_globs.match(keysym_to_name(keysym))):
+                return True
+        return self.globs is not None and self.globs.match(format_accelerator(mods, keysym)) is not None
+
+class PolicyRule:
+    __slots__ = ('index', 'app_id', 'shortcuts', 'allow', 'deny')
+
+    def __init__(self, index, data):
+        if not isinstance(data, dict):
+            raise ValueError(f"rule {index} is not an object")
+        self.index = index
+        self.app_id = data.get('app_id', '*')
+        shortcuts = data.get('shortcuts', ['*'])
+        allow = data.get('allow_triggers')
+        deny = data.get('deny_triggers', [])
+        for name, value in (('shortcuts', shortcuts), ('allow_triggers', allow or []), ('deny_triggers', deny)):
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"rule {index}: {name} must be a list of strings")
+        if not isinstance(self.app_id, str):
+            raise ValueError(f"rule {index}: app_id must be a string")
+        self.shortcuts = compile_globs(shortcuts)
+        self.allow = TriggerSet(allow) if allow is not None else None
+        self.deny = TriggerSet(deny) if deny else None
+
+    def approve(self, shortcuts):
+        # {s_id: trigger} if every shortcut is allowed, otherwise None
+        triggers = {}
+        for s_id, options in shortcuts:
+            if self.shortcuts is not None and self.shortcuts.match(s_id) is None:
+                return None
+            trigger = preferred_trigger(options)
+            if not trigger:
+                return None
+            # Rules are about the key combination, not how it is bound
+            key = parse_accelerator(trigger)
+            if not key[1]:
+                return None
+            if self.allow is not None and not self.allow.matches(key):
+                return None
+            if self.deny is not None and self.deny.matches(key):
+                return None
+            triggers[s_id] = trigger
+        return triggers
+
+class CompiledPolicy:
+    # Rules indexed by exact app_id, with the glob rules checked after them.
+    # The rules that apply to an app_id are resolved once per app_id.
+    def __init__(self, rules):
+        self.rules = rules
+        self.by_app_id = {}
+        self.glob_rules = []
+        for rule in rules:
+            if is_glob(rule.app_id):
+                self.glob_rules.append((re.compile(fnmatch.translate(rule.app_id)), rule))
+            else:
+                self.by_app_id.setdefault(rule.app_id, []).append(rule)
+        self.resolved = {}
+
+    @classmethod
+    def parse(cls, text):
+        data = json.loads(text)
+        if not isinstance(data, dict) or not isinstance(data.get('rules', []), list):
+            raise ValueError("expected an object with a list of rules")
+        return cls([PolicyRule(index, rule) for index, rule in enumerate(data.get('rules', []))])
+
+    def rules_for(self, app_id):
+        rules = self.resolved.get(app_id)
+        if rules is None:
+            rules = list(self.by_app_id.get(app_id, ()))
+            rules.extend(rule for pattern, rule in self.glob_rules if pattern.match(app_id))
+            rules.sort(key=lambda rule: rule.index)
+            self.resolved[app_id] = rules
+        return rules
+
+    def approve(self, app_id, shortcuts):
+        for rule in self.rules_for(app_id):
+            triggers = rule.approve(shortcuts)
+            if triggers is not None:
+                return rule, triggers
+        return None, None
+
+class ApprovalPolicy:
+    def __init__(self, path=None):
+        self.path = path or default_policy_path()
+        self.compiled = CompiledPolicy([])
+        self.monitor = None
+        self.reload_source = 0
+        self.approved = 0
+
+    def start(self):
+        self.load()
+        try:
+            self.monitor = Gio.File.new_for_path(self.path).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        except GLib.Error as e:
+            logger.warning(f"Not watching policy {self.path} for changes: {e.message}")
+            return
+        self.monitor.connect("changed", self.on_file_changed)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            self.compiled = CompiledPolicy([])
+            return
+        except OSError as e:
+            logger.error(f"Could not read policy {self.path}: {e}")
+            return
+        try:
+            compiled = CompiledPolicy.parse(text)
+        except ValueError as e:
+            # A half-written or broken file keeps the rules loaded before it
+            logger.error(f"Ignoring invalid policy {self.path}: {e}")
+            return
+        self.compiled = compiled
+        logger.info(f"Loaded {len(compiled.rules)} auto-approval rules from {self.path}")
+
+    def on_file_changed(self, monitor, file, other_file, event_type):
+        if self.reload_source:
+            GLib.source_remove(self.reload_source)
+        self.reload_source = GLib.timeout_add(RELOAD_DELAY_MS, self.on_reload_timeout)
+
+    def on_reload_timeout(self):
+        self.reload_source = 0
+        self.load()
+        return GLib.SOURCE_REMOVE
+
+    def approve(self, app_id, shortcuts):
+        # The triggers to register without asking, or None to ask the user
+        if not shortcuts or not self.compiled.rules:
+            return None
+        rule, triggers = self.compiled.approve(app_id, shortcuts)
+        if rule is None:
+            return None
+        self.approved += 1
+        logger.info(f"Auto-approved {len(triggers)} shortcuts for {app_id} by policy rule {rule.index}")
+        return triggers
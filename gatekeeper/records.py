@@ -0,0 +1,49 @@
+import sys
+
+from gi.repository import GLib
+
+# Records of the portal state. There is one Shortcut per (session, shortcut
+# id), so these use __slots__ instead of a dict each. The app ids,
+# descriptions and triggers are interned, so many sessions of one app share
+# a single copy of each string.
+
+class ActivationRoute:
+    # Where the begin/end events of one action are delivered. The shortcut id
+    # variant is built once so a key press only has to wrap the timestamp.
+    __slots__ = ('sender', 'app_id', 'session_handle', 'shortcut_id', 'shortcut_id_variant')
+
+    def __init__(self, sender, app_id, session_handle, shortcut_id):
+        self.sender = sender
+        self.app_id = app_id
+        self.session_handle = session_handle
+        self.shortcut_id = shortcut_id
+        self.shortcut_id_variant = GLib.Variant('s', shortcut_id)
+
+class Shortcut:
+    # registration and route are None while the shortcut has no trigger in
+    # the compositor, e.g. when a rebind failed or the connection was lost
+    __slots__ = ('description', 'trigger_desc', 'registration', 'route')
+
+    def __init__(self, description, trigger_desc, registration=None, route=None):
+        self.description = sys.intern(description)
+        self.trigger_desc = sys.intern(trigger_desc)
+        self.registration = registration
+        self.route = route
+
+    @property
+    def token(self):
+        return self.registration.token if self.registration is not None else None
+
+    def bind(self, trigger_desc, registration, route):
+        self.trigger_desc = sys.intern(trigger_desc)
+        self.registration = registration
+        self.route = route
+
+class Session:
+    __slots__ = ('app_id', 'sender', 'shortcuts', 'object_id')
+
+    def __init__(self, app_id, sender):
+        self.app_id = sys.intern(app_id)
+        self.sender = sys.intern(sender) if sender else sender
+        self.shortcuts = {} # shortcut id -> Shortcut
+        self.object_id = 0 # registration id of the exported Session object
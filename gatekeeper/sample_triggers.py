@@ -0,0 +1,15 @@
+import itertools
+
+# Triggers for the simulated shortcuts of bench_e2e.py and the load
+# generator in test_client.py.
+
+MODIFIERS = ["<Control>", "<Alt>", "<Shift>", "<Super>", "<Control_R>", "<Alt_R>", "<Shift_R>", "<Super_R>"]
+KEYS = [chr(c) for c in range(ord('a'), ord('z') + 1)] + [str(d) for d in range(10)] + [f"F{n}" for n in range(1, 13)]
+
+def unique_triggers():
+    # Distinct (modifiers, key) combinations, so no two shortcuts share a
+    # compositor trigger
+    for count in range(1, len(MODIFIERS) + 1):
+        for mods in itertools.combinations(MODIFIERS, count):
+            for key in KEYS:
+                yield ''.join(mods) + key
@@ -0,0 +1,154 @@
+import collections
+import logging
+import os
+
+from gi.repository import GLib
+
+import tracing
+from tracing import tracer
+
+logger = logging.getLogger("Gatekeeper")
+
+# BindShortcuts requests that need the user's approval wait here for the
+# review dialog, of which only one is shown at a time. Requests that arrive
+# within COALESCE_MS of the first waiting one are reviewed together, at most
+# MAX_MERGED per dialog, taken from the waiting apps in turn so one app
+# cannot crowd out the others. A request that has not been answered
+# TIMEOUT_MS after it arrived is answered with response 2.
+#
+# GATEKEEPER_BIND_COALESCE_MS and GATEKEEPER_BIND_TIMEOUT_MS override the
+# defaults.
+
+COALESCE_MS = 200
+TIMEOUT_MS = 120000
+MAX_MERGED = 8
+
+def env_ms(name, default):
+    try:
+        return max(int(os.environ.get(name, default)), 0)
+    except ValueError:
+        return default
+
+class BindRequest:
+    __slots__ = ('session_handle', 'app_id', 'shortcuts', 'invocation', 'received_at', 'deadline_source', 'answered')
+
+    def __init__(self, session_handle, app_id, shortcuts, invocation):
+        self.session_handle = session_handle
+        self.app_id = app_id
+        self.shortcuts = shortcuts
+        self.invocation = invocation
+        self.received_at = GLib.get_monotonic_time()
+        self.deadline_source = None
+        self.answered = False
+
+class BindScheduler:
+    # show_dialog(requests, on_answer) puts up one review dialog for the
+    # requests and returns it; on_answer(answers) is to be called with the
+    # approved {s_id: trigger} of each request, or None for each if the
+    # dialog was cancelled. The dialog is destroyed here if every request in
+    # it ran out of time first.
+    def __init__(self, app, show_dialog):
+        self.app = app
+        self.show_dialog = show_dialog
+        self.coalesce_ms = env_ms('GATEKEEPER_BIND_COALESCE_MS', COALESCE_MS)
+        self.timeout_ms = env_ms('GATEKEEPER_BIND_TIMEOUT_MS', TIMEOUT_MS)
+        self.queues = collections.OrderedDict() # app_id -> deque of BindRequest, next app first
+        self.queued = 0
+        self.dialog = None
+        self.reviewing = []
+        self.coalesce_source = None
+        self.dialogs = 0
+        self.merged = 0
+        self.timed_out = 0
+        self.max_wait_us = 0
+
+    def depth(self):
+        return self.queued + sum(1 for request in self.reviewing if not request.answered)
+
+    def submit(self, session_handle, app_id, shortcuts, invocation):
+        request = BindRequest(session_handle, app_id, shortcuts, invocation)
+        if self.timeout_ms:
+            request.deadline_source = GLib.timeout_add(self.timeout_ms, self.on_deadline, request)
+        self.queues.setdefault(app_id, collections.deque()).append(request)
+        self.queued += 1
+        self.schedule()
+
+    def schedule(self):
+        if self.dialog is not None or self.coalesce_source is not None or not self.queued:
+            return
+        self.coalesce_source = GLib.timeout_add(self.coalesce_ms, self.on_coalesced)
+
+    def on_coalesced(self):
+        self.coalesce_source = None
+        requests = self.take(MAX_MERGED)
+        if requests:
+            self.dialogs += 1
+            self.merged += len(requests) - 1
+            self.reviewing = requests
+            self.dialog = self.show_dialog(requests, self.on_answer)
+        return GLib.SOURCE_REMOVE
+
+    def take(self, count):
+        # One request from each waiting app in turn
+        requests = []
+        while self.queues and len(requests) < count:
+            app_id, queue = next(iter(self.queues.items()))
+            requests.append(queue.popleft())
+            self.queued -= 1
+            if queue:
+                self.queues.move_to_end(app_id)
+            else:
+                del self.queues[app_id]
+        return requests
+
+    def on_answer(self, answers):
+        requests, self.reviewing, self.dialog = self.reviewing, [], None
+        for request, triggers in zip(requests, answers):
+            if request.answered:
+                continue
+            self.settle(request)
+            if triggers is None:
+                self.app.finish_bind(request.invocation, 1, {})
+            else:
+                self.app.register_shortcuts_sequence(request.session_handle, request.shortcuts, triggers, request.invocation)
+        self.schedule()
+
+    def on_deadline(self, request):
+        request.deadline_source = None
+        logger.warning(f"BindShortcuts for {request.session_handle} was not answered within {self.timeout_ms} ms")
+        self.timed_out += 1
+        self.drop(request, 2)
+        return GLib.SOURCE_REMOVE
+
+    def cancel(self, invocation):
+        # Answers a request that is still waiting here with response 2;
+        # False if it is not here
+        for request in [r for queue in self.queues.values() for r in queue] + self.reviewing:
+            if request.invocation is invocation and not request.answered:
+                self.drop(request, 2)
+                return True
+        return False
+
+    def drop(self, request, response):
+        queue = self.queues.get(request.app_id)
+        if queue is not None and request in queue:
+            queue.remove(request)
+            self.queued -= 1
+            if not queue:
+                del self.queues[request.app_id]
+        self.settle(request)
+        self.app.finish_bind(request.invocation, response, {})
+        if self.dialog is not None and all(r.answered for r in self.reviewing):
+            dialog, self.dialog, self.reviewing = self.dialog, None, []
+            dialog.destroy()
+            self.schedule()
+
+    def settle(self, request):
+        request.answered = True
+        if request.deadline_source is not None:
+            GLib.source_remove(request.deadline_source)
+            request.deadline_source = None
+        now = GLib.get_monotonic_time()
+        self.max_wait_us = max(self.max_wait_us, now - request.received_at)
+        if tracer.enabled:
+            tracer.latency(tracing.BIND_WAIT, request.received_at, now)
@@ -0,0 +1,147 @@
+import cProfile
+import logging
+import tracemalloc
+
+from gi.repository import GLib, Gio
+
+from tracing import tracer
+
+logger = logging.getLogger("Gatekeeper")
+
+# Statistics and profiling control for a running gatekeeper, registered on
+# the portal object next to the GlobalShortcuts interface:
+#
+#   gdbus call --session --dest org.freedesktop.impl.portal.desktop.mir \
+#     --object-path /org/freedesktop/portal/desktop \
+#     --method org.freedesktop.impl.portal.desktop.mir.Gatekeeper.Stats.GetStats
+
+STATS_XML = """
+<node>
+  <interface name="org.freedesktop.impl.portal.desktop.mir.Gatekeeper.Stats">
+    <method name="GetStats">
+      <arg type="a{sv}" name="stats" direction="out"/>
+    </method>
+    <method name="SetTracing">
+      <arg type="b" name="enabled" direction="in"/>
+    </method>
+    <method name="ResetLatencies"/>
+    <method name="StartProfile"/>
+    <method name="StopProfile">
+      <arg type="s" name="path" direction="in"/>
+    </method>
+    <method name="StartMallocTracing">
+      <arg type="u" name="frames" direction="in"/>
+    </method>
+    <method name="TakeMallocSnapshot">
+      <arg type="s" name="path" direction="in"/>
+    </method>
+    <method name="StopMallocTracing"/>
+    <method name="ListAllShortcuts">
+      <arg type="ao" name="session_handles" direction="in"/>
+      <arg type="a{ov}" name="listings" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+ERROR_FAILED = "org.freedesktop.DBus.Error.Failed"
+
+class GatekeeperStats:
+    def __init__(self, app):
+        self.app = app
+        self.profile = None
+        self.registration_id = None
+
+    def register(self, connection, object_path):
+        interface_info = Gio.DBusNodeInfo.new_for_xml(STATS_XML).interfaces[0]
+        self.registration_id = connection.register_object(object_path, interface_info, self.on_method_call, None, None)
+
+    def on_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        method = getattr(self, method_name, None)
+        try:
+            result = method(*parameters.unpack())
+        except (RuntimeError, OSError, ValueError) as e:
+            logger.warning("Stats.%s failed: %s", method_name, e)
+            invocation.return_dbus_error(ERROR_FAILED, str(e))
+            return
+        invocation.return_value(result)
+
+    def GetStats(self):
+        app = self.app
+        live = app.live_objects()
+        stats = {name: GLib.Variant('u', count) for name, count in live.items()}
+        stats['pending_invocations'] = GLib.Variant('u', len(app.pending_binds))
+        channels = app.delivery.channels.values() if app.delivery else ()
+        pending = delivered = dropped = failed = 0
+        for channel in channels:
+            pending += channel.in_flight + len(channel.queue)
+            delivered += channel.delivered
+            dropped += channel.dropped
+            failed += channel.failed
+        stats['pending_activations'] = GLib.Variant('u', pending)
+        stats['delivered'] = GLib.Variant('t', delivered)
+        stats['dropped'] = GLib.Variant('t', dropped)
+        stats['failed'] = GLib.Variant('t', failed)
+        if app.changes:
+            stats['changes_emitted'] = GLib.Variant('t', app.changes.emitted)
+            stats['changes_coalesced'] = GLib.Variant('t', app.changes.coalesced)
+        scheduler = app.scheduler
+        stats['bind_queue_depth'] = GLib.Variant('u', scheduler.depth())
+        stats['bind_dialogs'] = GLib.Variant('t', scheduler.dialogs)
+        stats['bind_merged'] = GLib.Variant('t', scheduler.merged)
+        stats['bind_timed_out'] = GLib.Variant('t', scheduler.timed_out)
+        stats['bind_wait_max_us'] = GLib.Variant('t', scheduler.max_wait_us)
+        stats['capabilities'] = GLib.Variant('u', app.capabilities or 0)
+        stats['reconnects'] = GLib.Variant('u', app.reconnects)
+        stats['last_recovery_us'] = GLib.Variant('t', app.last_recovery_us)
+        stats['policy_rules'] = GLib.Variant('u', len(app.policy.compiled.rules))
+        stats['policy_approved'] = GLib.Variant('t', app.policy.approved)
+        stats['tracing'] = GLib.Variant('b', tracer.enabled)
+        stats['profiling'] = GLib.Variant('b', self.profile is not None)
+        stats['malloc_tracing'] = GLib.Variant('b', tracemalloc.is_tracing())
+        for name, histogram in tracer.stats().items():
+            for key, value in histogram.items():
+                stats[f'{name}_{key}'] = GLib.Variant('t', value)
+        return GLib.Variant('(a{sv})', (stats,))
+
+    def SetTracing(self, enabled):
+        tracer.enable(enabled)
+        logger.info("Tracing %s", "enabled" if enabled else "disabled")
+
+    def ResetLatencies(self):
+        tracer.reset()
+
+    def StartProfile(self):
+        if self.profile is not None:
+            raise RuntimeError("Profiler already running")
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        logger.info("Profiler started")
+
+    def StopProfile(self, path):
+        if self.profile is None:
+            raise RuntimeError("Profiler not running")
+        profile, self.profile = self.profile, None
+        profile.disable()
+        profile.dump_stats(path)
+        logger.info("Profile written to %s", path)
+
+    def StartMallocTracing(self, frames):
+        if tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracing already running")
+        tracemalloc.start(max(frames, 1))
+        logger.info("Allocation tracing started")
+
+    def TakeMallocSnapshot(self, path):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracing not running")
+        tracemalloc.take_snapshot().dump(path)
+        logger.info("Allocation snapshot written to %s", path)
+
+    def StopMallocTracing(self):
+        tracemalloc.stop()
+
+    def ListAllShortcuts(self, session_handles):
+        # The cached ListShortcuts payloads, each an a(sa{sv}), by session
+        listings = self.app.portal.listings_for(session_handles)
+        return GLib.Variant('(a{ov})', (listings,))
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger("Gatekeeper")
+
+# Journal operations, stored as compact JSON arrays, one per line:
+#   ["put", app_id, shortcut_id, trigger, description]
+#   ["del", app_id, shortcut_id]
+OP_PUT = "put"
+OP_DEL = "del"
+
+# The journal is rewritten with only the live records once it holds this
+# many entries and more than twice as many entries as live records
+COMPACT_MIN_ENTRIES = 64
+
+def default_store_path():
+    state_home = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(state_home, 'gatekeeper', 'shortcuts.journal')
+
+def is_valid_op(op):
+    if not isinstance(op, list) or not op or not all(isinstance(field, str) for field in op):
+        return False
+    return (op[0] == OP_PUT and len(op) == 5) or (op[0] == OP_DEL and len(op) == 3)
+
+class ShortcutStore:
+    # Approved (app_id, shortcut id, trigger, description) records, kept in an
+    # append-only journal. Nothing is read from disk until the first lookup.
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        self.records = None # app_id -> {shortcut_id: (trigger, description)}
+        self.entries = 0
+        self.journal = None
+        # The journal ends in a torn line without a newline, which the next
+        # entry must not be appended to
+        self.unterminated = False
+
+    def ensure_loaded(self):
+        # Never raises: whatever could be read is used, the rest is lost
+        if self.records is not None:
+            return
+        self.records = {}
+        self.entries = 0
+        try:
+            # Lines are decoded one by one so a damaged line loses only itself
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    self.apply_line(line.decode('utf-8', errors='replace'))
+                    self.unterminated = not line.endswith(b'\n')
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Could not read shortcut store {self.path}: {e}")
+        logger.info(f"Loaded {self.count()} stored shortcuts from {self.path}")
+
+    def apply_line(self, line):
+        try:
+            op = json.loads(line)
+        except ValueError:
+            op = None
+        if not is_valid_op(op):
+            # A torn final write after a crash, or an entry this version does
+            # not know; everything else is still valid
+            logger.warning(f"Ignoring corrupt shortcut store entry: {line.strip()!r}")
+            return
+        self.entries += 1
+        if op[0] == OP_PUT:
+            self.records.setdefault(op[1], {})[op[2]] = (op[3], op[4])
+        else:
+            app = self.records.get(op[1])
+            if app is not None:
+                app.pop(op[2], None)
+                if not app:
+                    del self.records[op[1]]
+
+    def count(self):
+        return sum(len(app) for app in self.records.values())
+
+    def lookup(self, app_id):
+        self.ensure_loaded()
+        return self.records.get(app_id, {})
+
+    def all_records(self):
+        self.ensure_loaded()
+        for app_id, shortcuts in self.records.items():
+            for s_id, (trigger, description) in shortcuts.items():
+                yield app_id, s_id, trigger, description
+
+    def put(self, app_id, s_id, trigger, description):
+        self.ensure_loaded()
+        record = (trigger, description)
+        if self.records.get(app_id, {}).get(s_id) == record:
+            return
+        self.records.setdefault(app_id, {})[s_id] = record
+        self.append([OP_PUT, app_id, s_id, trigger, description])
+
+    def remove(self, app_id, s_id):
+        self.ensure_loaded()
+        app = self.records.get(app_id)
+        if app is None or s_id not in app:
+            return
+        del app[s_id]
+        if not app:
+            del self.records[app_id]
+        self.append([OP_DEL, app_id, s_id])
+
+    def append(self, op):
+        try:
+            if self.journal is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.journal = open(self.path, 'a', encoding='utf-8')
+            if self.unterminated:
+                self.journal.write('\n')
+                self.unterminated = False
+            self.journal.write(json.dumps(op, separators=(',', ':')) + '\n')
+            self.journal.flush()
+        except OSError as e:
+            logger.error(f"Could not write shortcut store {self.path}: {e}")
+            return
+        self.entries += 1
+        if self.entries >= COMPACT_MIN_ENTRIES and self.entries > 2 * self.count():
+            self.compact()
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for app_id, s_id, trigger, description in self.all_records():
+                    f.write(json.dumps([OP_PUT, app_id, s_id, trigger, description], separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not compact shortcut store {self.path}: {e}")
+            return
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.entries = self.count()
+        self.unterminated = False
+        logger.debug(f"Compacted shortcut store to {self.entries} entries")
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
+import argparse
+import collections
+import json
+import os
+import random
+import resource
 import sys
+import time
 import gi
 import signal
 
 gi.require_version('Gio', '2.0')
 from gi.repository import Gio, GLib
 
+from sample_triggers import unique_triggers
+
 # XML for the interface we (the client) will expose to receive events
 # [FIXED] Removed session_handle argument to match Gatekeeper's call signature (sua{sv})
 CLIENT_XML = """
@@ -147,6 +156,11 @@ class TestClient:
             ("duplicate-quit", {
                 "description": GLib.Variant("s", "Quit Application"),
                 "preferred_trigger": GLib.Variant("s", "<Control>q")
+            }),
+            ("undo", {
+                "description": GLib.Variant("s", "Undo (same key in every layout)"),
+                "preferred_trigger": GLib.Variant("s", "<Alt>z"),
+                "trigger_kind": GLib.Variant("s", "code")
             })
         ]
 
@@ -215,7 +229,264 @@ class TestClient:
         except KeyboardInterrupt:
             print("\n\n🛑 Shutting down...")
 
+# Load generation mode (--load)
+#
+# Simulates many clients at once, each with its own bus connection (unless
+# --shared-connection), session and request handles, and drives
+# CreateSession, BindShortcuts and ListShortcuts through async calls. Set
+# GATEKEEPER_AUTO_ACCEPT=1 on gatekeeper so no dialog has to be answered.
+# When gatekeeper runs with GATEKEEPER_TRACE=1, every Activated call carries
+# the time gatekeeper received the key press in its options, which gives
+# the delivery latency. --press-fifo writes "press TOKEN" commands for
+# fake_compositor.py (started as: fake_compositor.py --commands FIFO) to
+# generate activations. The FIFO is opened before anything else, and fails
+# at once if no compositor is reading it.
+
+SESSION_PREFIX = "/org/freedesktop/portal/desktop/session/load"
+REQUEST_PREFIX = "/org/freedesktop/portal/desktop/request/load"
+RECEIVED_TIME_OPTION = "received_time_us"
+
+def raise_fd_limit():
+    # Every client connection is a socket
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def latency_summary(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    def at(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+    return {'count': len(ordered), 'p50_ms': at(50), 'p90_ms': at(90), 'p99_ms': at(99), 'max_ms': ordered[-1] * 1000}
+
+class TriggerDistribution:
+    # Triggers handed out to the simulated shortcuts: all distinct ("unique"),
+    # drawn uniformly from a pool of common ones ("shared"), or drawn with a
+    # Zipf skew over that pool ("zipf")
+    def __init__(self, kind, pool_size, seed):
+        self.kind = kind
+        self.unique = unique_triggers()
+        self.pool = [next(self.unique) for _ in range(pool_size)] if kind != 'unique' else []
+        self.random = random.Random(seed)
+        self.weights = [1 / (rank + 1) ** 1.1 for rank in range(pool_size)] if kind == 'zipf' else None
+
+    def next(self):
+        if self.kind == 'unique':
+            return next(self.unique)
+        if self.kind == 'zipf':
+            return self.random.choices(self.pool, self.weights)[0]
+        return self.random.choice(self.pool)
+
+class LoadClient:
+    def __init__(self, generator, index):
+        self.generator = generator
+        self.index = index
+        self.connection = None
+        self.session_handle = f"{SESSION_PREFIX}/c{index}"
+        self.requests = 0
+
+    def request_handle(self):
+        self.requests += 1
+        return f"{REQUEST_PREFIX}/c{self.index}_{self.requests}"
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.loop = GLib.MainLoop()
+        self.interface_info = Gio.DBusNodeInfo.new_for_xml(CLIENT_XML).interfaces[0]
+        self.address = Gio.dbus_address_get_for_bus_sync(Gio.BusType.SESSION, None)
+        self.shared_connection = None
+        self.triggers = TriggerDistribution(args.triggers, args.trigger_pool, args.seed)
+        self.waiting = collections.deque(range(args.clients))
+        self.clients = []
+        self.running = 0
+        self.latencies = collections.defaultdict(list)
+        self.responses = collections.defaultdict(collections.Counter)
+        self.errors = collections.Counter()
+        self.activated_without_time = 0
+        self.deactivated = 0
+        self.tokens = []
+        self.press_fifo = None
+        self.presses_left = args.presses
+
+    def open_press_fifo(self):
+        # Fails with ENXIO instead of blocking when no compositor reads it
+        fd = os.open(self.args.press_fifo, os.O_WRONLY | os.O_NONBLOCK)
+        os.set_blocking(fd, True)
+        self.press_fifo = os.fdopen(fd, 'w')
+
+    def run(self):
+        raise_fd_limit()
+        if self.args.shared_connection:
+            self.shared_connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        started = time.monotonic()
+        concurrency = self.args.concurrency or self.args.clients
+        for _ in range(min(concurrency, self.args.clients)):
+            self.start_next()
+        if self.running:
+            self.loop.run()
+        bind_phase = time.monotonic() - started
+
+        if self.press_fifo and self.tokens:
+            GLib.timeout_add(self.args.press_interval_ms, self.press_next)
+            self.loop.run()
+        elif self.press_fifo:
+            self.press_fifo.close()
+        if self.args.listen > 0:
+            GLib.timeout_add(int(self.args.listen * 1000), self.loop.quit)
+            self.loop.run()
+        return self.report(bind_phase)
+
+    def start_next(self):
+        if not self.waiting:
+            return
+        client = LoadClient(self, self.waiting.popleft())
+        self.clients.append(client)
+        self.running += 1
+        if self.shared_connection:
+            self.on_connected(client, self.shared_connection)
+            return
+        flags = Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION
+        Gio.DBusConnection.new_for_address(self.address, flags, None, None, self.on_connect_done, client)
+
+    def on_connect_done(self, source, result, client):
+        try:
+            connection = Gio.DBusConnection.new_for_address_finish(result)
+        except GLib.Error:
+            self.errors['connect'] += 1
+            self.finish(client)
+            return
+        self.on_connected(client, connection)
+
+    def on_connected(self, client, connection):
+        client.connection = connection
+        connection.register_object(client.session_handle, self.interface_info, self.on_client_method_call, None, None)
+        self.call(client, "CreateSession", GLib.Variant("(oosa{sv})", (
+            client.request_handle(), client.session_handle, f"org.example.LoadClient{client.index}", {}
+        )), self.on_session_created)
+
+    def on_session_created(self, client, response, results):
+        shortcuts = [(f"shortcut{i}", {
+            "description": GLib.Variant("s", f"Load shortcut {i}"),
+            "preferred_trigger": GLib.Variant("s", self.triggers.next())
+        }) for i in range(self.args.shortcuts)]
+        self.call(client, "BindShortcuts", GLib.Variant("(ooa(sa{sv})sa{sv})", (
+            client.request_handle(), client.session_handle, shortcuts, "", {}
+        )), self.on_shortcuts_bound)
+
+    def on_shortcuts_bound(self, client, response, results):
+        for s_id, data in results.get('shortcuts', []):
+            token = data.get('trigger_action_token')
+            if token:
+                self.tokens.append(token)
+        self.call(client, "ListShortcuts", GLib.Variant("(oo)", (client.request_handle(), client.session_handle)),
+                  self.on_shortcuts_listed)
+
+    def on_shortcuts_listed(self, client, response, results):
+        self.finish(client)
+
+    def call(self, client, method, args, next_step):
+        started = time.monotonic()
+
+        def on_done(connection, result, data):
+            try:
+                response, results = connection.call_finish(result).unpack()
+            except GLib.Error:
+                self.errors[method] += 1
+                self.finish(client)
+                return
+            self.latencies[method].append(time.monotonic() - started)
+            self.responses[method][response] += 1
+            if response != 0:
+                self.finish(client)
+                return
+            next_step(client, response, results)
+        client.connection.call(
+            "org.freedesktop.impl.portal.desktop.mir", "/org/freedesktop/portal/desktop",
+            "org.freedesktop.impl.portal.GlobalShortcuts", method, args, None,
+            Gio.DBusCallFlags.NONE, self.args.timeout_ms, None, on_done, None)
+
+    def finish(self, client):
+        self.running -= 1
+        self.start_next()
+        if not self.running:
+            self.loop.quit()
+
+    def press_next(self):
+        self.press_fifo.write(f"press {random.choice(self.tokens)}\n")
+        self.press_fifo.flush()
+        self.presses_left -= 1
+        if self.presses_left:
+            return GLib.SOURCE_CONTINUE
+        self.press_fifo.close()
+        # Leave time for the last deliveries before reporting
+        GLib.timeout_add(500, self.loop.quit)
+        return GLib.SOURCE_REMOVE
+
+    def on_client_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        if method_name == "Activated":
+            s_id, timestamp, options = parameters.unpack()
+            received = options.get(RECEIVED_TIME_OPTION)
+            if received is None:
+                self.activated_without_time += 1
+            else:
+                self.latencies['Activated'].append((GLib.get_monotonic_time() - received) / 1e6)
+        elif method_name == "Deactivated":
+            self.deactivated += 1
+        invocation.return_value(None)
+
+    def report(self, bind_phase):
+        return {
+            'clients': self.args.clients,
+            'shortcuts_per_client': self.args.shortcuts,
+            'triggers': self.args.triggers,
+            'bind_phase_s': bind_phase,
+            'clients_per_s': self.args.clients / bind_phase if bind_phase else 0,
+            'latency': {method: latency_summary(samples) for method, samples in self.latencies.items()},
+            'responses': {method: {str(r): n for r, n in counts.items()} for method, counts in self.responses.items()},
+            'errors': dict(self.errors),
+            'activated_without_timestamp': self.activated_without_time,
+            'deactivated': self.deactivated
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Gatekeeper test client and load generator")
+    parser.add_argument('--load', action='store_true', help="run as a load generator instead of the interactive test")
+    parser.add_argument('--clients', type=int, default=1000, help="simulated clients")
+    parser.add_argument('--concurrency', type=int, default=0, help="clients in flight at once (0: all)")
+    parser.add_argument('--shortcuts', type=int, default=3, help="shortcuts per client")
+    parser.add_argument('--triggers', choices=('unique', 'shared', 'zipf'), default='unique', help="trigger distribution")
+    parser.add_argument('--trigger-pool', type=int, default=50, help="common triggers for shared and zipf")
+    parser.add_argument('--shared-connection', action='store_true', help="one bus connection for all clients")
+    parser.add_argument('--timeout-ms', type=int, default=60000, help="D-Bus call timeout")
+    parser.add_argument('--press-fifo', help="fake_compositor.py command FIFO to inject key presses into")
+    parser.add_argument('--presses', type=int, default=0, help="key presses to inject")
+    parser.add_argument('--press-interval-ms', type=int, default=2, help="time between injected presses")
+    parser.add_argument('--listen', type=float, default=0, help="seconds to keep listening for activations")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for trigger selection")
+    parser.add_argument('--report', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if not args.load:
+        TestClient().run()
+        return
+
+    generator = LoadGenerator(args)
+    if args.press_fifo and args.presses:
+        try:
+            generator.open_press_fifo()
+        except OSError as e:
+            print(f"Cannot open {args.press_fifo}: {e.strerror}; start fake_compositor.py --commands {args.press_fifo} first",
+                  file=sys.stderr)
+            return 1
+    report = generator.run()
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal.SIG_DFL)
-    client = TestClient()
-    client.run()
+    sys.exit(main())
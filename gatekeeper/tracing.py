@@ -0,0 +1,117 @@
+import os
+
+from gi.repository import GLib
+
+# Low-overhead tracing of the registration and activation paths.
+#
+# Stages are recorded with their monotonic timestamp (microseconds, the clock
+# of GLib.get_monotonic_time) into a fixed-size ring buffer, and the two
+# end-to-end latencies are kept in histograms. Callers test tracer.enabled
+# before recording, so a disabled tracer costs one attribute lookup.
+# Set GATEKEEPER_TRACE=1 to enable it at startup.
+
+DBUS_RECEIVED = "dbus-received"
+DIALOG_SHOWN = "dialog-shown"
+DIALOG_ANSWERED = "dialog-answered"
+TRIGGER_DONE = "trigger-done"
+TOKEN_RECEIVED = "token-received"
+REGISTERED = "registered"
+ACTION_BEGIN = "action-begin"
+ACTION_END = "action-end"
+ACTIVATED_SENT = "activated-sent"
+DEACTIVATED_SENT = "deactivated-sent"
+ACTIVATED_DELIVERED = "activated-delivered"
+
+REGISTRATION = "registration"
+ACTIVATION = "activation"
+# From losing the compositor connection to having every shortcut registered again
+RECOVERY = "recovery"
+# From BindShortcuts arriving to the user answering it, or it timing out
+BIND_WAIT = "bind_wait"
+
+RING_SIZE = 4096
+
+# Bucket i holds latencies below 2**i microseconds; the last one is open
+HISTOGRAM_BUCKETS = 32
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, us):
+        if us < 0:
+            us = 0
+        self.buckets[min(us.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile, capped by
+        # the largest value seen
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(1 << i, self.max)
+        return self.max
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total // self.count if self.count else 0,
+            'p50_us': self.percentile(50),
+            'p99_us': self.percentile(99),
+            'max_us': self.max
+        }
+
+    def reset(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = self.total = self.max = 0
+
+class Tracer:
+    def __init__(self, size=RING_SIZE):
+        self.enabled = False
+        self.size = size
+        self.ring = [None] * size
+        self.next = 0
+        self.histograms = {REGISTRATION: Histogram(), ACTIVATION: Histogram(), RECOVERY: Histogram(), BIND_WAIT: Histogram()}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def record(self, stage, subject=None, now=None):
+        self.ring[self.next % self.size] = (GLib.get_monotonic_time() if now is None else now, stage, subject)
+        self.next += 1
+
+    def latency(self, name, started_at, now=None):
+        end = GLib.get_monotonic_time() if now is None else now
+        self.histograms[name].add(end - started_at)
+
+    def events(self):
+        # Recorded (timestamp, stage, subject) tuples, oldest first
+        if self.next <= self.size:
+            return self.ring[:self.next]
+        start = self.next % self.size
+        return self.ring[start:] + self.ring[:start]
+
+    def stats(self):
+        return {name: histogram.stats() for name, histogram in self.histograms.items()}
+
+    def reset(self):
+        self.ring = [None] * self.size
+        self.next = 0
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+tracer = Tracer()
+tracer.enable(os.environ.get('GATEKEEPER_TRACE', '') not in ('', '0'))
@@ -0,0 +1,329 @@
+import gi
+
+gi.require_version('Gtk', '4.0')
+from gi.repository import Gtk, Gio, GObject
+
+from accelerator import join_trigger, parse_accelerator, preferred_trigger, split_trigger
+
+# GTK user interface of the gatekeeper. Imported lazily by
+# GatekeeperApp.load_ui() so that the daemon runs without GTK until a
+# dialog or the shortcuts window is actually shown.
+
+def make_status_label():
+    label = Gtk.Label(xalign=0, wrap=True)
+    label.add_css_class("caption")
+    label.add_css_class("warning")
+    label.set_visible(False)
+    return label
+
+def show_status(label, message):
+    label.set_label(message or "")
+    label.set_visible(bool(message))
+
+class ShortcutDialog(Gtk.Dialog):
+    # Reviews one or more BindShortcuts requests, each an (app_id, shortcuts)
+    # pair. check_trigger(app_id, s_id, trigger) returns a message about a
+    # trigger that conflicts with a bound shortcut or cannot be registered,
+    # or None
+    def __init__(self, parent, requests, check_trigger=None):
+        super().__init__(title="Register Shortcuts", transient_for=parent, modal=True)
+        self.requests = requests
+        self.check_trigger = check_trigger
+        self.entries = {} # (request index, s_id) -> Gtk.Entry
+        # (request index, s_id) -> Gtk.CheckButton, active to bind the
+        # physical key rather than the keysym
+        self.physical_keys = {}
+        self.status_labels = {}
+
+        box = self.get_content_area()
+        box.set_spacing(10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+
+        if len(requests) == 1:
+            lbl = Gtk.Label(label="An application wants to register the following shortcuts:")
+        else:
+            lbl = Gtk.Label(label=f"{len(requests)} applications want to register the following shortcuts:")
+        box.append(lbl)
+
+        grid = Gtk.Grid()
+        grid.set_row_spacing(6)
+        grid.set_column_spacing(12)
+        box.append(grid)
+
+        row = 0
+        for index, (app_id, shortcuts) in enumerate(requests):
+            if len(requests) > 1:
+                header = Gtk.Label(label=app_id or "Unknown application", xalign=0)
+                header.add_css_class("heading")
+                grid.attach(header, 0, row, 3, 1)
+                row += 1
+            for s_id, options in shortcuts:
+                desc = options.get('description', s_id)
+                grid.attach(Gtk.Label(label=desc, xalign=0), 0, row, 1, 1)
+                entry = Gtk.Entry()
+                entry.set_placeholder_text("<Control>a")
+                preferred, by_code = split_trigger(preferred_trigger(options))
+                if preferred:
+                    entry.set_text(preferred)
+                self.entries[(index, s_id)] = entry
+                grid.attach(entry, 1, row, 1, 1)
+                physical_key = Gtk.CheckButton(label="Physical key", active=by_code)
+                physical_key.set_tooltip_text("Keep the same key when the keyboard layout changes")
+                self.physical_keys[(index, s_id)] = physical_key
+                grid.attach(physical_key, 2, row, 1, 1)
+                status = make_status_label()
+                self.status_labels[(index, s_id)] = status
+                grid.attach(status, 1, row + 1, 1, 1)
+                entry.connect("changed", self.on_entry_changed)
+                row += 2
+
+        self.add_button("Cancel", Gtk.ResponseType.CANCEL)
+        self.add_button("Register", Gtk.ResponseType.OK)
+        self.update_status()
+
+    def on_entry_changed(self, entry):
+        self.update_status()
+
+    def update_status(self):
+        # Every entry is checked again: a change to one can create or clear
+        # a duplicate in another
+        seen = {}
+        for (index, s_id), entry in self.entries.items():
+            text = entry.get_text()
+            key = parse_accelerator(text)
+            app_id = self.requests[index][0]
+            message = self.check_trigger(app_id, s_id, text) if self.check_trigger else None
+            if not message and key[1]:
+                if key in seen:
+                    message = f"Same as {seen[key]}"
+                else:
+                    seen[key] = s_id
+            show_status(self.status_labels[(index, s_id)], message)
+
+    def accepted(self, response_id):
+        return response_id == Gtk.ResponseType.OK
+
+    def get_triggers(self):
+        # The entered {s_id: trigger} of each request, in order
+        triggers = [{} for _ in self.requests]
+        for (index, s_id), entry in self.entries.items():
+            text = entry.get_text()
+            if text:
+                triggers[index][s_id] = join_trigger(text, self.physical_keys[(index, s_id)].get_active())
+        return triggers
+
+class ShortcutItem(GObject.Object):
+    # One row of the shortcuts list. sort_key and search_text are derived so
+    # that sorting and filtering run on the model in C.
+    session_path = GObject.Property(type=str, default="")
+    shortcut_id = GObject.Property(type=str, default="")
+    app_id = GObject.Property(type=str, default="")
+    description = GObject.Property(type=str, default="")
+    trigger = GObject.Property(type=str, default="")
+    subtitle = GObject.Property(type=str, default="")
+    sort_key = GObject.Property(type=str, default="")
+    search_text = GObject.Property(type=str, default="")
+
+    def __init__(self, session_path, shortcut_id, app_id):
+        super().__init__()
+        self.session_path = session_path
+        self.shortcut_id = shortcut_id
+        self.app_id = app_id
+        self.subtitle = f"{app_id} ({shortcut_id})"
+        # A shortcut without description or trigger never changes them in
+        # update(), so they are set here for it too
+        self.derive()
+
+    def update(self, description, trigger):
+        if description == self.description and trigger == self.trigger:
+            return False
+        self.description = description
+        self.trigger = trigger
+        self.derive()
+        return True
+
+    def derive(self):
+        self.sort_key = f"{self.app_id}\x00{self.description}\x00{self.shortcut_id}"
+        self.search_text = f"{self.description} {self.subtitle} {self.trigger}"
+
+# A plain Gtk.Window: the daemon is a Gio.Application and only loads GTK
+# once a window or dialog is needed
+class GatekeeperWindow(Gtk.Window):
+    def __init__(self, app):
+        super().__init__(title="Gatekeeper")
+        self.app = app
+        self.set_default_size(600, 400)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.set_child(box)
+        header = Gtk.HeaderBar()
+        self.set_titlebar(header)
+        label = Gtk.Label(label="Registered Shortcuts")
+        label.set_margin_top(10)
+        box.append(label)
+
+        search = Gtk.SearchEntry()
+        search.set_margin_start(10)
+        search.set_margin_end(10)
+        search.connect("search-changed", self.on_search_changed)
+        box.append(search)
+
+        # (session_path, s_id) -> ShortcutItem; portal changes are applied to
+        # the store as inserts, removals and in-place updates
+        self.items = {}
+        self.store = Gio.ListStore(item_type=ShortcutItem)
+        self.filter = Gtk.StringFilter.new(Gtk.PropertyExpression.new(ShortcutItem, None, "search-text"))
+        self.filter.set_match_mode(Gtk.StringFilterMatchMode.SUBSTRING)
+        self.filter.set_ignore_case(True)
+        filtered = Gtk.FilterListModel.new(self.store, self.filter)
+        sorter = Gtk.StringSorter.new(Gtk.PropertyExpression.new(ShortcutItem, None, "sort-key"))
+        sorted_model = Gtk.SortListModel.new(filtered, sorter)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_row_setup)
+        factory.connect("bind", self.on_row_bind)
+        factory.connect("unbind", self.on_row_unbind)
+        self.list_view = Gtk.ListView.new(Gtk.NoSelection.new(sorted_model), factory)
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_child(self.list_view)
+        scrolled.set_vexpand(True)
+        box.append(scrolled)
+        self.load_all()
+
+    def load_all(self):
+        new_items = []
+        for session_path, session in self.app.portal.sessions.items():
+            for s_id in session.shortcuts:
+                item = self.make_item(session_path, session, s_id)
+                new_items.append(item)
+        self.store.splice(self.store.get_n_items(), 0, new_items)
+
+    def make_item(self, session_path, session, s_id):
+        shortcut = session.shortcuts[s_id]
+        item = ShortcutItem(session_path, s_id, session.app_id)
+        item.update(shortcut.description, shortcut.trigger_desc)
+        self.items[(session_path, s_id)] = item
+        return item
+
+    def sync_shortcuts(self, session_path, s_ids):
+        session = self.app.portal.sessions.get(session_path)
+        new_items = []
+        for s_id in s_ids:
+            key = (session_path, s_id)
+            item = self.items.get(key)
+            shortcut = session.shortcuts.get(s_id) if session else None
+            if shortcut is None:
+                if item is not None:
+                    self.remove_item(key)
+            elif item is None:
+                new_items.append(self.make_item(session_path, session, s_id))
+            elif item.update(shortcut.description, shortcut.trigger_desc):
+                # Replacing the item in place makes the filter and sorter
+                # re-evaluate just this row
+                found, position = self.store.find(item)
+                if found:
+                    self.store.splice(position, 1, [item])
+        if new_items:
+            self.store.splice(self.store.get_n_items(), 0, new_items)
+
+    def remove_session(self, session_path):
+        for key in [key for key in self.items if key[0] == session_path]:
+            self.remove_item(key)
+
+    def remove_item(self, key):
+        item = self.items.pop(key)
+        found, position = self.store.find(item)
+        if found:
+            self.store.remove(position)
+
+    def on_search_changed(self, entry):
+        self.filter.set_search(entry.get_text())
+
+    def on_row_setup(self, factory, list_item):
+        row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        row.set_margin_start(10)
+        row.set_margin_end(10)
+        row.set_margin_top(5)
+        row.set_margin_bottom(5)
+        info_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        title = Gtk.Label(xalign=0)
+        title.add_css_class("heading")
+        subtitle = Gtk.Label(xalign=0)
+        subtitle.add_css_class("caption")
+        info_box.append(title)
+        info_box.append(subtitle)
+        info_box.set_hexpand(True)
+        row.append(info_box)
+        trigger = Gtk.Label()
+        row.append(trigger)
+        edit_btn = Gtk.Button(label="Edit")
+        edit_btn.connect("clicked", self.on_row_edit_clicked, list_item)
+        row.append(edit_btn)
+        forget_btn = Gtk.Button(label="Forget")
+        forget_btn.set_tooltip_text("Unbind and stop restoring it; the app has to ask again")
+        forget_btn.connect("clicked", self.on_row_forget_clicked, list_item)
+        row.append(forget_btn)
+        row.labels = (title, subtitle, trigger)
+        row.bindings = []
+        list_item.set_child(row)
+
+    def on_row_bind(self, factory, list_item):
+        row = list_item.get_child()
+        item = list_item.get_item()
+        for prop, label in zip(("description", "subtitle", "trigger"), row.labels):
+            row.bindings.append(item.bind_property(prop, label, "label", GObject.BindingFlags.SYNC_CREATE))
+
+    def on_row_unbind(self, factory, list_item):
+        row = list_item.get_child()
+        for binding in row.bindings:
+            binding.unbind()
+        row.bindings.clear()
+
+    def on_row_edit_clicked(self, btn, list_item):
+        item = list_item.get_item()
+        if item is not None:
+            self.on_edit_clicked(btn, item.session_path, item.shortcut_id)
+
+    def on_row_forget_clicked(self, btn, list_item):
+        item = list_item.get_item()
+        if item is not None:
+            self.app.forget_shortcut(item.session_path, item.shortcut_id)
+
+    def on_edit_clicked(self, btn, session_path, s_id):
+        session = self.app.portal.sessions.get(session_path)
+        if not session: return
+        shortcut = session.shortcuts.get(s_id)
+        if not shortcut: return
+        dialog = Gtk.Dialog(title="Edit Shortcut", transient_for=self, modal=True)
+        dialog.add_button("Cancel", Gtk.ResponseType.CANCEL)
+        dialog.add_button("Save", Gtk.ResponseType.OK)
+        content = dialog.get_content_area()
+        content.set_spacing(10)
+        content.set_margin_top(10)
+        content.set_margin_bottom(10)
+        content.set_margin_start(10)
+        content.set_margin_end(10)
+        entry = Gtk.Entry()
+        accel, by_code = split_trigger(shortcut.trigger_desc)
+        entry.set_text(accel)
+        content.append(Gtk.Label(label=f"New trigger for {shortcut.description or s_id}:"))
+        content.append(entry)
+        physical_key = Gtk.CheckButton(label="Physical key", active=by_code)
+        physical_key.set_tooltip_text("Keep the same key when the keyboard layout changes")
+        content.append(physical_key)
+        status = make_status_label()
+        content.append(status)
+        app_id = session.app_id
+        entry.connect("changed", lambda entry: show_status(
+            status, self.app.describe_conflict(app_id, s_id, entry.get_text())))
+        dialog.connect("response", self.on_edit_response, session_path, s_id, entry, physical_key)
+        dialog.show()
+
+    def on_edit_response(self, dialog, response_id, session_path, s_id, entry, physical_key):
+        dialog.destroy()
+        if response_id == Gtk.ResponseType.OK:
+            new_trigger = join_trigger(entry.get_text(), physical_key.get_active())
+            self.app.update_shortcut(session_path, s_id, new_trigger)
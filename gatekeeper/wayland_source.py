@@ -0,0 +1,85 @@
+import errno
+import logging
+
+from gi.repository import GLib
+
+from pywayland import ffi, lib
+
+logger = logging.getLogger("Gatekeeper")
+
+# GLib integration for a pywayland client Display.
+#
+# Follows the libwayland prepare_read protocol: before the main loop polls,
+# pending events are dispatched until the display can be prepared for reading
+# and the outgoing buffer is flushed. If the socket cannot take all of the
+# buffered requests (EAGAIN) the source also waits for the fd to become
+# writable and retries the flush, so nothing here ever blocks.
+class WaylandSource(GLib.Source):
+    def __init__(self, display, on_disconnect=None):
+        super().__init__()
+        self.display = display
+        self.on_disconnect = on_disconnect
+        self.reading = False
+        self.want_write = False
+        self.failed = False
+        self.base_events = GLib.IOCondition.IN | GLib.IOCondition.ERR | GLib.IOCondition.HUP
+        self.fd_tag = self.add_unix_fd(display.get_fd(), self.base_events)
+        self.set_name("wayland")
+
+    def prepare(self):
+        if self.failed:
+            return True, -1
+        ptr = self.display._ptr
+        # If check() was skipped in the previous iteration (a higher priority
+        # source was ready) we are still prepared and must not prepare again.
+        if not self.reading:
+            while lib.wl_display_prepare_read(ptr) != 0:
+                if lib.wl_display_dispatch_pending(ptr) == -1:
+                    self.failed = True
+                    return True, -1
+            self.reading = True
+        self.flush()
+        return self.failed, -1
+
+    def check(self):
+        revents = self.query_unix_fd(self.fd_tag)
+        if self.reading:
+            self.reading = False
+            # pywayland has no binding for wl_display_cancel_read; reading
+            # with nothing available is non-blocking and releases the
+            # prepared read all the same.
+            if lib.wl_display_read_events(self.display._ptr) == -1:
+                self.failed = True
+        if revents & GLib.IOCondition.OUT:
+            self.flush()
+        if revents & (GLib.IOCondition.ERR | GLib.IOCondition.HUP):
+            self.failed = True
+        return self.failed or bool(revents & GLib.IOCondition.IN)
+
+    def dispatch(self, callback, args):
+        if not self.failed and lib.wl_display_dispatch_pending(self.display._ptr) == -1:
+            self.failed = True
+        if self.failed:
+            error = lib.wl_display_get_error(self.display._ptr)
+            logger.error(f"[Wayland] Connection lost (error {error})")
+            if self.on_disconnect:
+                self.on_disconnect()
+            return GLib.SOURCE_REMOVE
+        self.flush()
+        return GLib.SOURCE_CONTINUE
+
+    def flush(self):
+        if self.failed:
+            return
+        want_write = False
+        if lib.wl_display_flush(self.display._ptr) == -1:
+            err = ffi.errno
+            if err == errno.EAGAIN:
+                want_write = True
+            elif err != errno.EINTR:
+                logger.error(f"[Wayland] Flush failed: {errno.errorcode.get(err, err)}")
+                self.failed = True
+        if want_write != self.want_write:
+            self.want_write = want_write
+            events = self.base_events | GLib.IOCondition.OUT if want_write else self.base_events
+            self.modify_unix_fd(self.fd_tag, events)